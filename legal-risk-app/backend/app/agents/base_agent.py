@@ -2,17 +2,58 @@
 Base agent configuration for Deep Agents using LangChain patterns
 Following the architecture documented in the repository
 """
-from typing import List, Optional, Dict, Any
+import asyncio
+import hashlib
+import os
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable, List, Optional, Dict, Any, Set, Tuple
+import aiofiles
 from langchain.agents import AgentExecutor, create_structured_chat_agent
 from langchain_anthropic import ChatAnthropic
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.tools import BaseTool
+from langchain_core.runnables import Runnable
+from app.agents.semantic_cache import get_semantic_cache
+from app.services.events import EventBroadcaster, EventQueue
 from config.settings import settings
 
+# Prompt structure shared by all agents; only the system prompt differs
+_PROMPT_SHELL = ChatPromptTemplate.from_messages([
+    ("system", "{system_prompt}"),
+    MessagesPlaceholder(variable_name="chat_history", optional=True),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad"),
+])
+
+# Output AgentExecutor returns when it gives up; never worth caching
+AGENT_STOPPED_OUTPUT = "Agent stopped due to iteration limit or time limit."
+
+
+# Global stream of agent events (streamed tokens)
+agent_events = EventBroadcaster()
+
+# Todo list of the main agent, as status events; available before any agent is built
+todo_events = EventBroadcaster(state=True)
+
+
+@lru_cache(maxsize=8)
+def _get_llm(model: str, temperature: float) -> ChatAnthropic:
+    """Get the shared LLM client for a model, so agents reuse one connection pool"""
+    return ChatAnthropic(
+        model=model,
+        anthropic_api_key=settings.anthropic_api_key,
+        temperature=temperature,
+        streaming=True,
+    )
+
 
 class BaseDeepAgent:
     """Base class for Deep Agents with middleware support"""
 
+    # Agent runnables by (system prompt, tool names, model); shared by all instances
+    _agent_cache: Dict[Tuple[str, Tuple[str, ...], str], Runnable] = {}
+
     def __init__(
         self,
         name: str,
@@ -22,6 +63,7 @@ class BaseDeepAgent:
         subagents: Optional[Dict[str, Any]] = None,
         max_iterations: int = 20,
         max_execution_time: Optional[float] = None,
+        cache_version: Optional[Callable[[], Awaitable[str]]] = None,
     ):
         self.name = name
         self.system_prompt = system_prompt
@@ -32,32 +74,34 @@ class BaseDeepAgent:
         self.max_execution_time = max_execution_time
 
         # Initialize LLM
-        self.llm = ChatAnthropic(
-            model=model,
-            anthropic_api_key=settings.anthropic_api_key,
-            temperature=0.7,
-        )
+        self.llm = _get_llm(model, 0.7)
 
         # Create agent
         self.agent_executor = self._create_agent()
 
+        # Response cache, scoped so agents never share each other's answers.
+        # cache_version identifies the data the agent's tools can see, so
+        # answers are not reused once that data changes
+        self.cache = get_semantic_cache() if settings.semantic_cache_enabled else None
+        self.cache_namespace = hashlib.sha256(
+            f"{name}\0{model}\0{system_prompt}".encode("utf-8")
+        ).hexdigest()
+        self.cache_version = cache_version
+
     def _create_agent(self) -> AgentExecutor:
         """Create the agent executor with tools"""
 
-        # Create prompt template
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", self.system_prompt),
-            MessagesPlaceholder(variable_name="chat_history", optional=True),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ])
-
-        # Create agent
-        agent = create_structured_chat_agent(
-            llm=self.llm,
-            tools=self.tools,
-            prompt=prompt,
-        )
+        # Create agent (a pure function of the prompt, tool schemas and model,
+        # so it is built once and reused by later instances)
+        key = (self.system_prompt, tuple(tool.name for tool in self.tools), self.model)
+        agent = BaseDeepAgent._agent_cache.get(key)
+        if agent is None:
+            agent = create_structured_chat_agent(
+                llm=self.llm,
+                tools=self.tools,
+                prompt=_PROMPT_SHELL.partial(system_prompt=self.system_prompt),
+            )
+            BaseDeepAgent._agent_cache[key] = agent
 
         # Create executor
         executor = AgentExecutor(
@@ -72,12 +116,52 @@ class BaseDeepAgent:
 
         return executor
 
+    async def get_cache_namespace(self) -> str:
+        """Cache namespace for a run now: the agent plus the current data version"""
+        if self.cache_version is None:
+            return self.cache_namespace
+        version = await self.cache_version()
+        return hashlib.sha256(f"{self.cache_namespace}\0{version}".encode("utf-8")).hexdigest()
+
     async def run(self, input_text: str, chat_history: Optional[List] = None) -> Dict[str, Any]:
         """Run the agent with the given input"""
-        result = await self.agent_executor.ainvoke({
+        # Only stateless runs are cacheable
+        use_cache = self.cache is not None and not chat_history
+
+        if use_cache:
+            cache_namespace = await self.get_cache_namespace()
+            cached = await self.cache.get(cache_namespace, input_text)
+            if cached is not None:
+                return {"input": input_text, "intermediate_steps": [], **cached}
+
+        inputs = {
             "input": input_text,
             "chat_history": chat_history or []
-        })
+        }
+
+        # Stream the run so tokens reach subscribers as they are generated;
+        # the first event belongs to the executor itself, whose end event
+        # carries the final result
+        result: Dict[str, Any] = {}
+        root_run_id = None
+        async for event in self.agent_executor.astream_events(inputs, version="v1"):
+            if root_run_id is None:
+                root_run_id = event["run_id"]
+
+            if event["event"] == "on_chat_model_stream":
+                content = event["data"]["chunk"].content
+                if content:
+                    agent_events.publish({
+                        "type": "token",
+                        "agent": self.name,
+                        "content": content,
+                    })
+            elif event["event"] == "on_chain_end" and event["run_id"] == root_run_id:
+                result = event["data"]["output"]
+
+        output = result.get("output")
+        if use_cache and output and output != AGENT_STOPPED_OUTPUT:
+            await self.cache.set(cache_namespace, input_text, {"output": output})
 
         return result
 
@@ -92,8 +176,23 @@ class TodoListMiddleware:
     Based on Deep Agents Middleware documentation
     """
 
-    def __init__(self):
+    def __init__(self, events: Optional[EventBroadcaster] = None):
         self.todos: List[Dict[str, str]] = []
+        # Copy of the todos rebuilt on each change and shared by all readers
+        self._snapshot: List[Dict[str, str]] = []
+        self._events = events or EventBroadcaster(state=True)
+
+    def subscribe(self, queue: Optional[EventQueue] = None) -> EventQueue:
+        """Receive a status event with the todo snapshot on every change"""
+        return self._events.subscribe(queue)
+
+    def unsubscribe(self, queue: EventQueue):
+        """Stop receiving todo updates"""
+        self._events.unsubscribe(queue)
+
+    def _publish(self):
+        self._snapshot = [dict(todo) for todo in self.todos]
+        self._events.publish({"type": "status", "todos": self._snapshot})
 
     def add_todo(self, task: str, status: str = "pending"):
         """Add a todo item"""
@@ -101,27 +200,33 @@ class TodoListMiddleware:
             "task": task,
             "status": status,
         })
+        self._publish()
 
     def update_todo(self, index: int, status: str):
         """Update todo status"""
         if 0 <= index < len(self.todos):
             self.todos[index]["status"] = status
+            self._publish()
+
+    def clear(self):
+        """Remove all todos"""
+        self.todos = []
+        self._publish()
 
     def get_todos(self) -> List[Dict[str, str]]:
-        """Get all todos"""
-        return self.todos
+        """Get all todos (a shared snapshot; do not modify)"""
+        return self._snapshot
 
     def format_todos(self) -> str:
         """Format todos as string"""
         if not self.todos:
             return "No todos yet."
 
-        formatted = "Current todos:\n"
-        for i, todo in enumerate(self.todos):
-            status_icon = "✓" if todo["status"] == "completed" else "○"
-            formatted += f"{i + 1}. [{status_icon}] {todo['task']} ({todo['status']})\n"
-
-        return formatted
+        lines = [
+            f"{i + 1}. [{'✓' if todo['status'] == 'completed' else '○'}] {todo['task']} ({todo['status']})"
+            for i, todo in enumerate(self.todos)
+        ]
+        return "Current todos:\n" + "\n".join(lines) + "\n"
 
 
 class FilesystemMiddleware:
@@ -130,40 +235,62 @@ class FilesystemMiddleware:
     Based on Deep Agents Middleware documentation
     """
 
+    # Workspace file listings by resolved base path, shared by all instances
+    _file_index: Dict[Path, Set[str]] = {}
+
     def __init__(self, base_path: str = "./data/agent_workspace"):
         self.base_path = base_path
-        import os
-        os.makedirs(base_path, exist_ok=True)
+        self.base = Path(base_path).resolve()
+        self.base.mkdir(parents=True, exist_ok=True)
+        # Directories known to exist, so repeated writes skip mkdir
+        self._created_dirs: Set[Path] = {self.base}
+
+        # Files are scanned from disk once, then tracked as they are written
+        if self.base not in FilesystemMiddleware._file_index:
+            FilesystemMiddleware._file_index[self.base] = set(self._walk_files())
+        self._files = FilesystemMiddleware._file_index[self.base]
+
+    def _resolve(self, file_path: str) -> Path:
+        """Resolve a workspace-relative path, rejecting paths outside the workspace"""
+        resolved = (self.base / file_path).resolve()
+        if not resolved.is_relative_to(self.base):
+            raise ValueError(f"Path is outside the workspace: {file_path}")
+        return resolved
 
     async def read_file(self, file_path: str) -> str:
         """Read a file"""
-        full_path = f"{self.base_path}/{file_path}"
         try:
-            with open(full_path, "r") as f:
-                return f.read()
+            full_path = self._resolve(file_path)
+            async with aiofiles.open(full_path, "r") as f:
+                return await f.read()
         except Exception as e:
             return f"Error reading file: {str(e)}"
 
     async def write_file(self, file_path: str, content: str) -> str:
         """Write a file"""
-        full_path = f"{self.base_path}/{file_path}"
         try:
+            full_path = self._resolve(file_path)
+
             # Create directory if needed
-            import os
-            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if full_path.parent not in self._created_dirs:
+                await asyncio.to_thread(full_path.parent.mkdir, parents=True, exist_ok=True)
+                self._created_dirs.add(full_path.parent)
 
-            with open(full_path, "w") as f:
-                f.write(content)
+            async with aiofiles.open(full_path, "w") as f:
+                await f.write(content)
+            self._files.add(full_path.relative_to(self.base).as_posix())
             return f"File written successfully: {file_path}"
         except Exception as e:
             return f"Error writing file: {str(e)}"
 
     async def list_files(self) -> List[str]:
         """List all files in workspace"""
-        import os
+        return list(self._files)
+
+    def _walk_files(self) -> List[str]:
         files = []
-        for root, dirs, filenames in os.walk(self.base_path):
+        for root, dirs, filenames in os.walk(self.base):
             for filename in filenames:
-                rel_path = os.path.relpath(os.path.join(root, filename), self.base_path)
+                rel_path = Path(root, filename).relative_to(self.base).as_posix()
                 files.append(rel_path)
         return files
@@ -5,39 +5,29 @@ Implements the three-tier agent architecture:
 2. Analysis SubAgent
 3. Create Report SubAgent
 """
-from typing import List, Dict, Any, Optional
+import asyncio
+from functools import lru_cache, partial
+from typing import Final, List, Dict, Any, Optional
 from langchain.tools import BaseTool, tool
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.agents.base_agent import BaseDeepAgent, TodoListMiddleware, FilesystemMiddleware
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app.agents.base_agent import BaseDeepAgent, TodoListMiddleware, FilesystemMiddleware, todo_events
+from app.agents.report import REPORT_FILENAME, generate_report, render_report
+from app.database.db import AsyncSessionLocal, current_db_session
+from app.models.document import DocumentBundle
+from app.services.document_processor import (
+    DOCUMENT_BUNDLE_ID,
+    get_corpus_version,
+    refresh_document_bundle,
+)
 from app.tools.document_tools import create_document_tools
 from app.tools.web_tools import create_web_tools
 from config.settings import settings
 import json
 
-
-class AnalysisSubAgent(BaseDeepAgent):
-    """
-    Analysis Deep SubAgent
-    - Model: Claude Sonnet 4.5
-    - System Prompt: Legal Analysis
-    - Middleware: TodoList, Filesystem, SubAgent
-    - Tools: Document Analysis + Web Research
-    """
-
-    def __init__(self, db_session: AsyncSession):
-        self.todo_middleware = TodoListMiddleware()
-        self.filesystem_middleware = FilesystemMiddleware()
-
-        # Document analysis tools
-        document_tools = create_document_tools(db_session)
-
-        # Web research tools
-        web_tools = create_web_tools()
-
-        # Combine all tools
-        all_tools = document_tools + web_tools
-
-        system_prompt = """You are a Legal Analysis expert assistant. Your role is to:
+# System prompts are fixed strings so every run sends a byte-identical prefix
+# that Anthropic's prompt cache can reuse; per-request data goes in the human turn
+ANALYSIS_SYSTEM_PROMPT: Final[str] = """You are a Legal Analysis expert assistant. Your role is to:
 
 1. Analyze company legal documents for potential risks, obligations, and key clauses
 2. Research relevant laws, regulations, and case precedents
@@ -45,15 +35,16 @@ class AnalysisSubAgent(BaseDeepAgent):
 4. Compare contract terms against industry standards
 
 You have access to:
-- Document analysis tools (list_documents, get_documents, get_page_text, get_page_image)
+- Document analysis tools (list_documents, get_documents, search_pages, get_page_text, get_page_image)
 - Web research tools (internet_search, url_content)
 
 When analyzing documents:
 1. Start by listing all available documents
 2. Review document summaries to identify which documents to analyze in depth
-3. For critical sections, get the full page text
-4. Only use get_page_image when you need to see visual elements like tables or signatures
-5. Research relevant legal precedents or regulations when needed
+3. Use search_pages to find the pages that mention a clause or term
+4. For critical sections, get the full page text
+5. Only use get_page_image when you need to see visual elements like tables or signatures
+6. Research relevant legal precedents or regulations when needed
 
 Focus on identifying:
 - Legal risks and liabilities
@@ -64,30 +55,7 @@ Focus on identifying:
 
 Be thorough but efficient with tool usage."""
 
-        super().__init__(
-            name="Analysis SubAgent",
-            system_prompt=system_prompt,
-            model=settings.agent_model,
-            tools=all_tools,
-            max_iterations=30,
-        )
-
-
-class CreateReportSubAgent(BaseDeepAgent):
-    """
-    Create Report SubAgent
-    - System Prompt: Create Legal Risk Analysis Report
-    - Middleware: Filesystem
-    - Tools: Document Analysis only
-    """
-
-    def __init__(self, db_session: AsyncSession):
-        self.filesystem_middleware = FilesystemMiddleware()
-
-        # Document analysis tools only
-        document_tools = create_document_tools(db_session)
-
-        system_prompt = """You are a Legal Report Generation specialist. Your role is to:
+CREATE_REPORT_SYSTEM_PROMPT: Final[str] = """You are a Legal Report Generation specialist. Your role is to:
 
 Create comprehensive, well-structured legal risk analysis reports based on the analysis provided.
 
@@ -122,12 +90,90 @@ Save the report using the filesystem tools available to you.
 
 You have access to document analysis tools if you need to reference specific details."""
 
+LEGAL_RISK_SYSTEM_PROMPT: Final[str] = """You are the main Legal Risk Analysis coordinator. Your role is to:
+
+1. Coordinate comprehensive legal risk analysis of company documents
+2. Delegate analysis tasks to specialized subagents
+3. Synthesize findings into actionable insights
+4. Ensure thorough coverage of all legal documents
+
+You have access to two subagents:
+- delegate_to_analysis: Use this to perform detailed legal analysis (unlimited use)
+- delegate_to_analysis_batch: Use this to run several independent analysis tasks in parallel (unlimited use)
+- delegate_to_create_report: Use this ONCE at the end to create the final report (use=1)
+
+Workflow:
+1. Start by understanding what documents are available
+2. Delegate analysis tasks to the Analysis SubAgent:
+   - Analyze each document for risks (batch independent per-document tasks together)
+   - Research relevant legal requirements
+   - Identify compliance issues
+3. Review and synthesize all findings
+4. Create a todo list of critical actions
+5. Finally, delegate to Create Report SubAgent to generate the comprehensive report
+
+You will be provided with summaries of all company legal documents to begin."""
+
+
+async def _corpus_version(session_factory: async_sessionmaker) -> str:
+    """Version of the documents the agents' tools can see, for response caching"""
+    async with session_factory() as db:
+        return await get_corpus_version(db)
+
+
+class AnalysisSubAgent(BaseDeepAgent):
+    """
+    Analysis Deep SubAgent
+    - Model: Claude Sonnet 4.5
+    - System Prompt: Legal Analysis
+    - Middleware: TodoList, Filesystem, SubAgent
+    - Tools: Document Analysis + Web Research
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.todo_middleware = TodoListMiddleware()
+        self.filesystem_middleware = FilesystemMiddleware()
+
+        # Document analysis tools
+        document_tools = create_document_tools(session_factory)
+
+        # Web research tools
+        web_tools = create_web_tools()
+
+        # Combine all tools
+        all_tools = document_tools + web_tools
+
+        super().__init__(
+            name="Analysis SubAgent",
+            system_prompt=ANALYSIS_SYSTEM_PROMPT,
+            model=settings.agent_model,
+            tools=all_tools,
+            max_iterations=30,
+            cache_version=partial(_corpus_version, session_factory),
+        )
+
+
+class CreateReportSubAgent(BaseDeepAgent):
+    """
+    Create Report SubAgent
+    - System Prompt: Create Legal Risk Analysis Report
+    - Middleware: Filesystem
+    - Tools: Document Analysis only
+    """
+
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.filesystem_middleware = FilesystemMiddleware()
+
+        # Document analysis tools only
+        document_tools = create_document_tools(session_factory)
+
         super().__init__(
             name="Create Report SubAgent",
-            system_prompt=system_prompt,
+            system_prompt=CREATE_REPORT_SYSTEM_PROMPT,
             model=settings.agent_model,
             tools=document_tools,
             max_iterations=15,
+            cache_version=partial(_corpus_version, session_factory),
         )
 
 
@@ -140,14 +186,13 @@ class LegalRiskAnalysisAgent(BaseDeepAgent):
     - Middleware: TodoList, Filesystem, SubAgent
     """
 
-    def __init__(self, db_session: AsyncSession):
-        self.todo_middleware = TodoListMiddleware()
+    def __init__(self, session_factory: async_sessionmaker = AsyncSessionLocal):
+        self.todo_middleware = TodoListMiddleware(todo_events)
         self.filesystem_middleware = FilesystemMiddleware()
-        self.db_session = db_session
 
         # Create subagents
-        self.analysis_subagent = AnalysisSubAgent(db_session)
-        self.create_report_subagent = CreateReportSubAgent(db_session)
+        self.analysis_subagent = AnalysisSubAgent(session_factory)
+        self.create_report_subagent = CreateReportSubAgent(session_factory)
 
         # Create tools for delegating to subagents
         @tool
@@ -160,6 +205,37 @@ class LegalRiskAnalysisAgent(BaseDeepAgent):
             result = await self.analysis_subagent.run(task)
             return result.get("output", "Analysis completed")
 
+        @tool
+        async def delegate_to_analysis_batch(tasks: List[str]) -> str:
+            """
+            Delegate several independent analysis tasks to the Analysis SubAgent in parallel.
+            Prefer this over delegate_to_analysis when tasks do not depend on each other,
+            e.g. one task per document.
+            Input: List of task descriptions for the analysis subagent.
+            """
+            semaphore = asyncio.Semaphore(settings.tool_concurrency_limit)
+
+            async def run_task(task: str) -> Dict[str, Any]:
+                async with semaphore:
+                    return await self.analysis_subagent.run(task)
+
+            results = await asyncio.gather(
+                *[run_task(task) for task in tasks],
+                return_exceptions=True,
+            )
+
+            # Results keep the order of the submitted tasks; a failed task is
+            # reported in place so the rest of the batch is still usable
+            outputs = []
+            for i, (task, result) in enumerate(zip(tasks, results), start=1):
+                if isinstance(result, Exception):
+                    output = f"Error: {type(result).__name__}: {result}"
+                else:
+                    output = result.get("output", "Analysis completed")
+                outputs.append(f"### Task {i}: {task}\n{output}")
+
+            return "\n\n".join(outputs)
+
         @tool
         async def delegate_to_create_report(analysis_summary: str) -> str:
             """
@@ -167,39 +243,25 @@ class LegalRiskAnalysisAgent(BaseDeepAgent):
             Use this ONCE at the end to generate the final risk analysis report.
             Input: Summary of all analysis findings to be compiled into a report.
             """
+            if settings.structured_report_enabled:
+                try:
+                    report = await generate_report(analysis_summary)
+                except Exception as e:
+                    return f"Error creating report: {str(e)}"
+                markdown = render_report(report)
+                await self.filesystem_middleware.write_file(REPORT_FILENAME, markdown)
+                return markdown
+
             result = await self.create_report_subagent.run(
                 f"Create a comprehensive legal risk analysis report based on:\n\n{analysis_summary}"
             )
             return result.get("output", "Report created")
 
-        subagent_tools = [delegate_to_analysis, delegate_to_create_report]
-
-        system_prompt = """You are the main Legal Risk Analysis coordinator. Your role is to:
-
-1. Coordinate comprehensive legal risk analysis of company documents
-2. Delegate analysis tasks to specialized subagents
-3. Synthesize findings into actionable insights
-4. Ensure thorough coverage of all legal documents
-
-You have access to two subagents:
-- delegate_to_analysis: Use this to perform detailed legal analysis (unlimited use)
-- delegate_to_create_report: Use this ONCE at the end to create the final report (use=1)
-
-Workflow:
-1. Start by understanding what documents are available
-2. Delegate analysis tasks to the Analysis SubAgent:
-   - Analyze each document for risks
-   - Research relevant legal requirements
-   - Identify compliance issues
-3. Review and synthesize all findings
-4. Create a todo list of critical actions
-5. Finally, delegate to Create Report SubAgent to generate the comprehensive report
-
-You will be provided with summaries of all company legal documents to begin."""
+        subagent_tools = [delegate_to_analysis, delegate_to_analysis_batch, delegate_to_create_report]
 
         super().__init__(
             name="Legal Risk Analysis Agent",
-            system_prompt=system_prompt,
+            system_prompt=LEGAL_RISK_SYSTEM_PROMPT,
             model=settings.agent_model,
             tools=subagent_tools,
             subagents={
@@ -207,31 +269,36 @@ You will be provided with summaries of all company legal documents to begin."""
                 "create_report": self.create_report_subagent,
             },
             max_iterations=40,
+            cache_version=partial(_corpus_version, session_factory),
         )
 
-    async def analyze_company_documents(self) -> Dict[str, Any]:
-        """Main entry point for legal risk analysis"""
-
-        # Get all document summaries
-        from sqlalchemy import select
-        from app.models.document import Document
+    async def analyze_company_documents(self, user_request: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Main entry point for legal risk analysis
+        Uses the request's session from current_db_session.
+        An optional user request is appended to the standard instructions.
+        """
+        # The agent is reused across requests; start each analysis fresh
+        self.todo_middleware.clear()
+
+        # Get all document summaries (one pre-built row, maintained at upload time)
+        db = current_db_session.get()
+        result = await db.execute(
+            select(DocumentBundle.payload).where(DocumentBundle.id == DOCUMENT_BUNDLE_ID)
+        )
+        all_summaries = result.scalar_one_or_none()
 
-        result = await self.db_session.execute(select(Document))
-        documents = result.scalars().all()
+        # Databases created before the bundle existed get it built once here
+        if all_summaries is None:
+            all_summaries = await refresh_document_bundle(db)
+            await db.commit()
 
-        if not documents:
+        if not all_summaries:
             return {
                 "status": "error",
                 "message": "No documents found in database. Please upload documents first."
             }
 
-        # Format document summaries
-        doc_summaries = []
-        for doc in documents:
-            doc_summaries.append(f"- Document {doc.id}: {doc.filename}\n  Summary: {doc.summdesc}")
-
-        all_summaries = "\n".join(doc_summaries)
-
         # Start analysis
         initial_message = f"""Company Legal Documents Analysis Request
 
@@ -250,8 +317,24 @@ Please perform a comprehensive legal risk analysis of all company legal document
 
 3. Create a comprehensive risk analysis report
 
+The per-document analyses are independent of each other. Run them together with a single
+delegate_to_analysis_batch call, with one task per document listed above.
+
 Begin the analysis process."""
 
+        if user_request:
+            initial_message += f"\n\nUser request:\n{user_request}"
+
         result = await self.run(initial_message)
 
         return result
+
+
+@lru_cache(maxsize=4)
+def _build_legal_risk_agent(model: str, settings_id: int) -> LegalRiskAnalysisAgent:
+    return LegalRiskAnalysisAgent()
+
+
+def get_legal_risk_agent() -> LegalRiskAnalysisAgent:
+    """Get the shared Legal Risk Analysis Agent, built once per model and settings"""
+    return _build_legal_risk_agent(settings.agent_model, id(settings))
@@ -0,0 +1,155 @@
+"""
+Structured legal risk report
+The report is produced by one model call as JSON matching RiskReport, then
+rendered to Markdown server-side with a fixed Jinja2 template.
+"""
+import json
+from typing import Final, List
+from jinja2 import Environment
+from pydantic import BaseModel, Field
+from app.services.anthropic_client import get_anthropic_client
+from config.settings import settings
+
+REPORT_FILENAME = "legal_risk_report.md"
+
+# A multi-document report runs to several thousand tokens of JSON
+REPORT_MAX_TOKENS = 8192
+
+# Seconds to wait for the whole reply; generating 8k tokens takes minutes, far
+# beyond the shared client's default timeout
+REPORT_TIMEOUT = 600.0
+
+
+class RiskItem(BaseModel):
+    """A single identified risk"""
+    title: str
+    document: str = Field(description="Document the risk was found in")
+    description: str
+
+
+class DocumentFinding(BaseModel):
+    """Detailed findings for one analyzed document"""
+    document: str
+    summary: str
+    key_clauses: List[str] = []
+    risks: List[str] = []
+    compliance_concerns: List[str] = []
+
+
+class RiskReport(BaseModel):
+    """Legal risk analysis report, in the structure of the Create Report SubAgent"""
+    executive_summary: str = Field(description="Overview of analyzed documents and key findings")
+    overall_risk_level: str = Field(description="high, medium or low")
+    high_risks: List[RiskItem] = []
+    medium_risks: List[RiskItem] = []
+    low_risks: List[RiskItem] = []
+    findings: List[DocumentFinding] = []
+    immediate_actions: List[str] = []
+    medium_term_improvements: List[str] = []
+    long_term_considerations: List[str] = []
+    references: List[str] = Field(default=[], description="Documents and regulations cited")
+
+
+REPORT_SYSTEM_PROMPT: Final[str] = f"""You are a Legal Report Generation specialist.
+
+Turn the legal risk analysis findings you are given into a structured report.
+Only use facts present in the findings; do not invent documents, clauses or regulations.
+
+Respond with a single JSON object that matches this JSON schema, and nothing else:
+{json.dumps(RiskReport.model_json_schema())}"""
+
+def _table_cell(value: str) -> str:
+    """Text safe inside a Markdown table cell"""
+    return " ".join(str(value).split()).replace("|", "\\|")
+
+
+_template_env = Environment(trim_blocks=True, lstrip_blocks=True)
+_template_env.filters["cell"] = _table_cell
+
+REPORT_TEMPLATE = _template_env.from_string("""# Legal Risk Analysis Report
+
+## 1. Executive Summary
+
+{{ report.executive_summary }}
+
+**Overall risk level:** {{ report.overall_risk_level | capitalize }}
+
+## 2. Risk Assessment
+{% for heading, risks in [("High-Priority Risks", report.high_risks), ("Medium-Priority Risks", report.medium_risks), ("Low-Priority Risks", report.low_risks)] %}
+
+### {{ heading }}
+
+{% if risks %}
+| Risk | Document | Description |
+|------|----------|-------------|
+{% for risk in risks %}
+| {{ risk.title | cell }} | {{ risk.document | cell }} | {{ risk.description | cell }} |
+{% endfor %}
+{% else %}
+None identified.
+{% endif %}
+{% endfor %}
+
+## 3. Detailed Findings
+{% for finding in report.findings %}
+
+### {{ finding.document }}
+
+{{ finding.summary }}
+{% for heading, items in [("Key clauses and terms", finding.key_clauses), ("Identified risks", finding.risks), ("Compliance concerns", finding.compliance_concerns)] if items %}
+
+**{{ heading }}**
+
+{% for item in items %}
+- {{ item }}
+{% endfor %}
+{% endfor %}
+{% endfor %}
+
+## 4. Recommendations
+{% for heading, items in [("Immediate actions required", report.immediate_actions), ("Medium-term improvements", report.medium_term_improvements), ("Long-term considerations", report.long_term_considerations)] if items %}
+
+### {{ heading }}
+
+{% for item in items %}
+- {{ item }}
+{% endfor %}
+{% endfor %}
+{% if report.references %}
+
+## 5. Appendix
+
+### References
+
+{% for reference in report.references %}
+- {{ reference }}
+{% endfor %}
+{% endif %}
+""")
+
+
+async def generate_report(analysis_summary: str) -> RiskReport:
+    """
+    Generate the report from analysis findings in a single model call.
+    Raises ValueError if the reply is cut off or is not a valid report.
+    """
+    response = await get_anthropic_client().messages.create(
+        model=settings.agent_model,
+        max_tokens=REPORT_MAX_TOKENS,
+        temperature=0,
+        timeout=REPORT_TIMEOUT,
+        system=REPORT_SYSTEM_PROMPT,
+        messages=[
+            {"role": "user", "content": f"Analysis findings:\n\n{analysis_summary}"},
+            # Prefilled so the reply is the bare JSON object
+            {"role": "assistant", "content": "{"},
+        ],
+    )
+    if response.stop_reason != "end_turn":
+        raise ValueError(f"Report generation stopped early ({response.stop_reason})")
+    return RiskReport.model_validate(json.loads("{" + response.content[0].text))
+
+
+def render_report(report: RiskReport) -> str:
+    """Render a report as Markdown"""
+    return REPORT_TEMPLATE.render(report=report)
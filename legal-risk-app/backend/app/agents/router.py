@@ -0,0 +1,57 @@
+"""
+Request router for legal risk analysis
+A small, cheap model decides whether a request needs the full multi-agent
+pipeline, a single Analysis SubAgent run, or only a cached answer.
+"""
+from functools import lru_cache
+from typing import Literal, Optional
+from pydantic import BaseModel
+from langchain_anthropic import ChatAnthropic
+from langchain_core.messages import HumanMessage
+from config.settings import settings
+
+Route = Literal["cached", "single_doc", "full"]
+
+ROUTES = ("cached", "single_doc", "full")
+
+ROUTER_PROMPT = """Classify this request to a legal document risk analysis system.
+Answer with exactly one word:
+cached - the user wants to see an analysis or report that was already produced
+single_doc - the request concerns one specific document
+full - the request needs analysis across several or all documents
+
+Request: What are the termination risks in document 3?
+Answer: single_doc
+
+Request: {text}
+Answer:"""
+
+
+class AnalysisRequest(BaseModel):
+    """Optional user request for an analysis run"""
+    query: Optional[str] = None
+
+
+@lru_cache(maxsize=1)
+def _get_router_llm() -> ChatAnthropic:
+    return ChatAnthropic(
+        model=settings.router_model,
+        anthropic_api_key=settings.anthropic_api_key,
+        temperature=0,
+        max_tokens=5,
+    )
+
+
+async def classify_request(text: str) -> Route:
+    """Classify a request; anything unexpected falls back to the full pipeline"""
+    try:
+        response = await _get_router_llm().ainvoke([
+            HumanMessage(content=ROUTER_PROMPT.format(text=text))
+        ])
+    except Exception as e:
+        print(f"Router error, using full pipeline: {e}")
+        return "full"
+
+    words = response.content.strip().lower().split()
+    label = words[0] if words else ""
+    return label if label in ROUTES else "full"
@@ -0,0 +1,201 @@
+"""
+Semantic response cache for Deep Agents
+Exact prompt matches are served from a SQLite table by SHA-256 hash; paraphrased
+prompts are matched by cosine similarity of their embeddings in a FAISS index.
+Embeddings are kept as float16, both on disk and inside the index.
+Prompts longer than the embedding model's input window are matched exactly only.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from config.settings import settings
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# Neighbours per node in the HNSW graph
+HNSW_M = 32
+
+# Prompts at least this similar to a cached one are not stored again
+DEDUP_THRESHOLD = 0.98
+
+# Nearest neighbours checked for a semantic hit
+SEARCH_CANDIDATES = 5
+
+# Numbers and file names, e.g. "Document 3" or "nda_2024.pdf". Prompts built from
+# one template differ only in these, so entries must agree on them to match
+IDENTIFIER_PATTERN = re.compile(r"[\w-]+\.[a-z]{2,4}\b|\d+")
+
+
+@lru_cache(maxsize=1)
+def get_embedding_model():
+    """Load the sentence embedding model once per process"""
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL)
+
+
+@lru_cache(maxsize=256)
+def embed(text: str) -> np.ndarray:
+    """Embed text as a unit-length float32 vector, so inner product is cosine similarity"""
+    return get_embedding_model().encode(text, normalize_embeddings=True).astype(np.float32)
+
+
+def fits_embedding(text: str) -> bool:
+    """Whether the whole text is within the model's input window; longer input is truncated"""
+    model = get_embedding_model()
+    return len(model.tokenizer(text)["input_ids"]) <= model.max_seq_length
+
+
+def identifiers(text: str) -> str:
+    """The numbers and file names in a prompt, in a canonical form"""
+    return " ".join(sorted(IDENTIFIER_PATTERN.findall(text.lower())))
+
+
+class SemanticCache:
+    """
+    LLM response cache keyed on prompt text
+    Entries are scoped by namespace so different agents never share responses.
+    """
+
+    def __init__(self, db_path: Path, threshold: float = 0.9):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS llm_cache (
+                hash TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                response TEXT NOT NULL,
+                identifiers TEXT
+            )"""
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(llm_cache)")}
+        if "identifiers" not in columns:
+            # Entries from before identifiers were recorded only match exactly
+            self._conn.execute("ALTER TABLE llm_cache ADD COLUMN identifiers TEXT")
+        self._conn.commit()
+        # namespace -> (index, (cache hash, identifiers) per entry in index insertion order)
+        self._indexes: Dict[str, Tuple[faiss.Index, List[Tuple[str, str]]]] = {}
+
+    @staticmethod
+    def _new_index(dim: int) -> faiss.Index:
+        """HNSW graph over fp16 scalar-quantized vectors; needs no real training"""
+        index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_fp16, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.train(np.zeros((1, dim), dtype=np.float32))
+        return index
+
+    @staticmethod
+    def _decode(blob: bytes, dim: int) -> np.ndarray:
+        # Rows written before embeddings were stored as float16 hold float32
+        dtype = np.float32 if len(blob) == dim * 4 else np.float16
+        return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+    @staticmethod
+    def _hash(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def _get_index(self, namespace: str) -> Tuple[faiss.Index, List[Tuple[str, str]]]:
+        """Get the vector index for a namespace, loading it from SQLite on first use"""
+        if namespace not in self._indexes:
+            # Entries without identifiers or an embedding are exact-match only
+            rows = self._conn.execute(
+                """SELECT hash, embedding, identifiers FROM llm_cache
+                WHERE namespace = ? AND identifiers IS NOT NULL AND length(embedding) > 0""",
+                (namespace,)
+            ).fetchall()
+            dim = get_embedding_model().get_sentence_embedding_dimension()
+            index = self._new_index(dim)
+            if rows:
+                index.add(np.stack([self._decode(row[1], dim) for row in rows]))
+            self._indexes[namespace] = (index, [(row[0], row[2]) for row in rows])
+        return self._indexes[namespace]
+
+    def _nearest(self, namespace: str, text: str, embedding: np.ndarray, threshold: float) -> Optional[str]:
+        """Hash of the most similar entry with the same identifiers, if similar enough. Needs the lock."""
+        index, entries = self._get_index(namespace)
+        if index.ntotal == 0:
+            return None
+        text_identifiers = identifiers(text)
+        scores, ids = index.search(embedding[np.newaxis, :], min(SEARCH_CANDIDATES, index.ntotal))
+        for score, i in zip(scores[0], ids[0]):
+            if i < 0 or score < threshold:
+                break
+            key, entry_identifiers = entries[i]
+            if entry_identifiers == text_identifiers:
+                return key
+        return None
+
+    def _get(self, namespace: str, text: str) -> Optional[Dict[str, Any]]:
+        # 1. Exact match
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE hash = ?", (self._hash(namespace, text),)
+            ).fetchone()
+        if row:
+            return json.loads(row[0])
+
+        # 2. Nearest neighbour above the similarity threshold, for prompts the
+        # embedding sees in full
+        if not fits_embedding(text):
+            return None
+        embedding = embed(text)
+        with self._lock:
+            key = self._nearest(namespace, text, embedding, self.threshold)
+            if key is None:
+                return None
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE hash = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, namespace: str, text: str, response: Dict[str, Any]):
+        key = self._hash(namespace, text)
+        if not fits_embedding(text):
+            # Exact match only; a truncated embedding would match unrelated prompts
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO llm_cache (hash, namespace, embedding, response) VALUES (?, ?, ?, ?)",
+                    (key, namespace, b"", json.dumps(response)),
+                )
+                self._conn.commit()
+            return
+
+        embedding = embed(text)
+        text_identifiers = identifiers(text)
+        with self._lock:
+            # Near-duplicates of a cached prompt would only ever return the same hit
+            if self._nearest(namespace, text, embedding, DEDUP_THRESHOLD) is not None:
+                return
+
+            cursor = self._conn.execute(
+                """INSERT OR IGNORE INTO llm_cache (hash, namespace, embedding, response, identifiers)
+                VALUES (?, ?, ?, ?, ?)""",
+                (key, namespace, embedding.astype(np.float16).tobytes(), json.dumps(response), text_identifiers),
+            )
+            self._conn.commit()
+            if cursor.rowcount:
+                index, entries = self._indexes[namespace]
+                index.add(embedding[np.newaxis, :])
+                entries.append((key, text_identifiers))
+
+    async def get(self, namespace: str, text: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached response; embedding and SQLite run off the event loop"""
+        return await asyncio.to_thread(self._get, namespace, text)
+
+    async def set(self, namespace: str, text: str, response: Dict[str, Any]):
+        """Store a response for later exact or semantic hits"""
+        await asyncio.to_thread(self._set, namespace, text, response)
+
+
+@lru_cache(maxsize=1)
+def get_semantic_cache() -> SemanticCache:
+    """Get the process-wide semantic cache"""
+    return SemanticCache(settings.semantic_cache_path, settings.semantic_cache_threshold)
@@ -2,11 +2,18 @@
 Human-in-the-loop approval system
 Based on Deep Agents documentation: Human-in-the-loop configuration
 """
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Deque
+from collections import deque
 from enum import Enum
-from pydantic import BaseModel
+from itertools import count, islice
+from pydantic import BaseModel, ConfigDict, PrivateAttr, computed_field
 from datetime import datetime
-import uuid
+import secrets
+import time
+from app.services.events import EventBroadcaster, EventQueue
+
+# Number of answered requests kept in history; older ones are dropped
+MAX_APPROVAL_HISTORY = 1000
 
 
 class ApprovalType(str, Enum):
@@ -32,15 +39,37 @@ class ApprovalStatus(str, Enum):
 
 class ApprovalRequest(BaseModel):
     """Approval request model"""
+    model_config = ConfigDict(frozen=False, arbitrary_types_allowed=True)
+
     id: str
     type: ApprovalType
-    timestamp: datetime
+    timestamp: float  # Unix time
     status: ApprovalStatus
     data: Dict[str, Any]
     agent_name: str
     description: str
     highlights: Optional[Dict[str, Any]] = None
 
+    # Cached JSON form, reset whenever a field is assigned
+    _json: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+
+    @computed_field
+    @property
+    def iso_ts(self) -> str:
+        """Timestamp as an ISO 8601 string, formatted only when serialized"""
+        return datetime.fromtimestamp(self.timestamp).isoformat()
+
+    def __setattr__(self, name: str, value: Any):
+        super().__setattr__(name, value)
+        if name != "_json":
+            self._json = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the JSON-ready form, serialized once per change"""
+        if self._json is None:
+            self._json = self.model_dump(mode="json")
+        return self._json
+
 
 class ApprovalResponse(BaseModel):
     """Response to approval request"""
@@ -58,7 +87,23 @@ class HumanApprovalSystem:
 
     def __init__(self):
         self.pending_approvals: Dict[str, ApprovalRequest] = {}
-        self.approval_history: List[ApprovalRequest] = []
+        self.approval_history: Deque[ApprovalRequest] = deque(maxlen=MAX_APPROVAL_HISTORY)
+        # Request IDs are "<per-process prefix>-<counter>": unique within the
+        # process and far cheaper than uuid4
+        self._id_prefix = secrets.token_hex(4)
+        self._id_counter = count(1)
+        self._events = EventBroadcaster(state=True)
+
+    def subscribe(self, queue: Optional[EventQueue] = None) -> EventQueue:
+        """Receive an approval_required event with the pending count on every change"""
+        return self._events.subscribe(queue)
+
+    def unsubscribe(self, queue: EventQueue):
+        """Stop receiving approval updates"""
+        self._events.unsubscribe(queue)
+
+    def _publish(self):
+        self._events.publish({"type": "approval_required", "count": len(self.pending_approvals)})
 
     def create_approval_request(
         self,
@@ -71,9 +116,9 @@ class HumanApprovalSystem:
         """Create a new approval request"""
 
         request = ApprovalRequest(
-            id=str(uuid.uuid4()),
+            id=f"{self._id_prefix}-{next(self._id_counter)}",
             type=approval_type,
-            timestamp=datetime.now(),
+            timestamp=time.time(),
             status=ApprovalStatus.PENDING,
             data=data,
             agent_name=agent_name,
@@ -82,6 +127,7 @@ class HumanApprovalSystem:
         )
 
         self.pending_approvals[request.id] = request
+        self._publish()
         return request
 
     def get_pending_approvals(self) -> List[ApprovalRequest]:
@@ -101,7 +147,7 @@ class HumanApprovalSystem:
     ) -> Optional[ApprovalRequest]:
         """Respond to an approval request"""
 
-        request = self.pending_approvals.get(request_id)
+        request = self.pending_approvals.pop(request_id, None)
         if not request:
             return None
 
@@ -114,7 +160,7 @@ class HumanApprovalSystem:
 
         # Move to history
         self.approval_history.append(request)
-        del self.pending_approvals[request_id]
+        self._publish()
 
         return request
 
@@ -122,10 +168,12 @@ class HumanApprovalSystem:
         """Clear all pending approvals"""
         self.approval_history.extend(self.pending_approvals.values())
         self.pending_approvals.clear()
+        self._publish()
 
     def get_approval_history(self, limit: int = 50) -> List[ApprovalRequest]:
         """Get approval history"""
-        return self.approval_history[-limit:]
+        end = len(self.approval_history)
+        return list(islice(self.approval_history, max(0, end - limit), end))
 
 
 # Global approval system instance
@@ -1,15 +1,41 @@
+from contextvars import ContextVar
+from sqlalchemy import event, inspect, make_url, text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.orm import declarative_base
 from config.settings import settings
-from app.models.document import Base
+from app.models.document import Base, PAGE_TEXT_FTS_DDL, PAGE_TEXT_FTS_INSERT, compress_text
+
+# SQLite connections wait for a competing writer instead of failing at once
+# with "database is locked"
+connect_args = {}
+if make_url(settings.database_url).get_backend_name() == "sqlite":
+    connect_args["timeout"] = settings.db_busy_timeout
 
 # Create async engine
 engine = create_async_engine(
     settings.database_url,
-    echo=True,
-    future=True
+    echo=False,
+    # aiosqlite defaults to NullPool, which opens a connection per checkout
+    poolclass=AsyncAdaptedQueuePool,
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle,
+    connect_args=connect_args,
 )
 
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine.sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """WAL lets readers proceed during writes; mmap speeds up large reads"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.close()
+
 # Create session factory
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -17,11 +43,62 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False
 )
 
+# Session of the request currently being served, for long-lived objects
+# (e.g. the cached analysis agent) that must not hold a session themselves
+current_db_session: ContextVar[AsyncSession] = ContextVar("current_db_session")
+
 async def init_db():
     """Initialize database tables"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+        # create_all only adds indexes along with new tables; add indexes
+        # introduced later to tables that already exist
+        def create_missing_indexes(sync_conn):
+            for table in Base.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(sync_conn, checkfirst=True)
+
+        await conn.run_sync(create_missing_indexes)
+
+        # create_all does not alter existing tables either; add nullable
+        # columns introduced later
+        def add_missing_columns(sync_conn):
+            inspector = inspect(sync_conn)
+            for table in Base.metadata.sorted_tables:
+                existing = {column["name"] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        column_type = column.type.compile(dialect=sync_conn.dialect)
+                        sync_conn.execute(text(
+                            f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                        ))
+
+        await conn.run_sync(add_missing_columns)
+        await conn.execute(PAGE_TEXT_FTS_DDL)
+
+        # Databases from before page text was compressed keep it as plain text;
+        # compress and index it once, then drop the old column
+        def migrate_page_text(sync_conn):
+            columns = {column["name"] for column in inspect(sync_conn).get_columns("pages")}
+            if "page_text" not in columns:
+                return
+            rows = sync_conn.execute(
+                text("SELECT id, page_text FROM pages WHERE page_text IS NOT NULL")
+            ).all()
+            if rows:
+                sync_conn.execute(
+                    text("UPDATE pages SET page_text_compressed = :data WHERE id = :id"),
+                    [{"id": row.id, "data": compress_text(row.page_text)} for row in rows]
+                )
+                sync_conn.execute(
+                    PAGE_TEXT_FTS_INSERT,
+                    [{"id": row.id, "page_text": row.page_text} for row in rows]
+                )
+            sync_conn.execute(text("ALTER TABLE pages DROP COLUMN page_text"))
+
+        await conn.run_sync(migrate_page_text)
+
 async def get_db():
     """Dependency for getting database session"""
     async with AsyncSessionLocal() as session:
@@ -3,17 +3,25 @@ Main FastAPI application for Legal Risk Analysis
 """
 from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from starlette.websockets import WebSocketState
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import asyncio
+import json
+import aiofiles
 import uvicorn
 import os
 
 from config.settings import settings
-from app.database.db import init_db, get_db
+from app.database.db import init_db, get_db, current_db_session, AsyncSessionLocal
 from app.models.document import Document, Page
-from app.services.document_processor import DocumentProcessor
-from app.agents.legal_agents import LegalRiskAnalysisAgent
+from app.services.document_processor import DocumentProcessor, image_media_type
+from app.agents.base_agent import agent_events, todo_events
+from app.agents.legal_agents import LegalRiskAnalysisAgent, get_legal_risk_agent
+from app.agents.router import AnalysisRequest, classify_request
+from app.tools.web_tools import close_http_session
+from app.services.anthropic_client import close_anthropic_client
 from app.api.approval_system import (
     approval_system,
     ApprovalResponse,
@@ -21,12 +29,14 @@ from app.api.approval_system import (
     ApprovalType
 )
 from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Legal Risk Analysis API",
     description="Deep Agent-powered legal document risk analysis system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
 )
 
 # Configure CORS
@@ -38,6 +48,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+
 # Global state
 document_processor = DocumentProcessor()
 current_agent: LegalRiskAnalysisAgent = None
@@ -52,6 +65,13 @@ async def startup_event():
     print(f"Images path: {settings.images_path}")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared clients"""
+    await close_http_session()
+    await close_anthropic_client()
+
+
 # ============================================================================
 # Document Management Endpoints
 # ============================================================================
@@ -67,9 +87,9 @@ async def upload_document(
 
     # Save uploaded file
     file_path = settings.documents_path / file.filename
-    with open(file_path, "wb") as f:
-        content = await file.read()
-        f.write(content)
+    async with aiofiles.open(file_path, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await out.write(chunk)
 
     # Process document
     try:
@@ -83,23 +103,37 @@ async def upload_document(
 
 
 @app.post("/api/documents/process-all")
-async def process_all_documents(db: AsyncSession = Depends(get_db)):
+async def process_all_documents():
     """Process all PDF documents in the documents folder"""
     try:
-        documents = await document_processor.process_all_documents(db)
+        documents = await document_processor.process_all_documents(AsyncSessionLocal)
         return {
             "status": "success",
             "processed_count": len(documents),
-            "documents": [doc.to_dict() for doc in documents]
+            "documents": [doc.to_dict() for doc in documents],
+            # With batch summaries, summaries arrive later; see /api/documents/summaries/status
+            "summaries_pending": document_processor.summaries_pending,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
 
 
+@app.get("/api/documents/summaries/status")
+async def get_summaries_status():
+    """Status of batch summaries being generated in the background"""
+    return {
+        "pending": document_processor.summaries_pending,
+        "batch_ids": sorted(document_processor.active_batch_ids),
+    }
+
+
 @app.get("/api/documents")
 async def list_documents(db: AsyncSession = Depends(get_db)):
     """List all documents"""
-    result = await db.execute(select(Document))
+    # Only page ids are needed, for the page counts
+    result = await db.execute(
+        select(Document).options(selectinload(Document.pages).load_only(Page.id))
+    )
     documents = result.scalars().all()
     return {
         "documents": [doc.to_dict() for doc in documents]
@@ -109,7 +143,9 @@ async def list_documents(db: AsyncSession = Depends(get_db)):
 @app.get("/api/documents/{doc_id}")
 async def get_document(doc_id: int, db: AsyncSession = Depends(get_db)):
     """Get a specific document with all pages"""
-    result = await db.execute(select(Document).where(Document.id == doc_id))
+    result = await db.execute(
+        select(Document).where(Document.id == doc_id).options(selectinload(Document.pages))
+    )
     document = result.scalar_one_or_none()
 
     if not document:
@@ -135,7 +171,7 @@ async def get_page_image(doc_id: int, page_num: int, db: AsyncSession = Depends(
     if not os.path.exists(page.page_image_path):
         raise HTTPException(status_code=404, detail="Image file not found")
 
-    return FileResponse(page.page_image_path, media_type="image/png")
+    return FileResponse(page.page_image_path, media_type=image_media_type(page.page_image_path))
 
 
 # ============================================================================
@@ -143,24 +179,54 @@ async def get_page_image(doc_id: int, page_num: int, db: AsyncSession = Depends(
 # ============================================================================
 
 @app.post("/api/agent/start-analysis")
-async def start_analysis(db: AsyncSession = Depends(get_db)):
-    """Start the legal risk analysis"""
+async def start_analysis(
+    request: Optional[AnalysisRequest] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Start the legal risk analysis
+    Without a query the full pipeline runs. With a query, a small model routes
+    it to a cached answer, a single Analysis SubAgent run, or the full pipeline.
+    """
     global current_agent
 
+    query = request.query if request else None
+    token = current_db_session.set(db)
     try:
-        # Create agent
-        current_agent = LegalRiskAnalysisAgent(db)
-
-        # Start analysis (this will run in background in production)
-        result = await current_agent.analyze_company_documents()
+        # Get agent (built on first use, then reused)
+        current_agent = get_legal_risk_agent()
+        analysis_subagent = current_agent.analysis_subagent
+
+        route = await classify_request(query) if query else "full"
+
+        result = None
+        if route == "cached" and analysis_subagent.cache is not None:
+            cache_namespace = await analysis_subagent.get_cache_namespace()
+            cached = await analysis_subagent.cache.get(cache_namespace, query)
+            if cached is not None:
+                result = {"input": query, "intermediate_steps": [], **cached}
+            else:
+                # Nothing to reuse yet
+                route = "full"
+        elif route == "single_doc":
+            result = await analysis_subagent.run(query)
+        else:
+            route = "full"
+
+        if result is None:
+            # Start analysis (this will run in background in production)
+            result = await current_agent.analyze_company_documents(query)
 
         return {
             "status": "success",
             "message": "Analysis started",
+            "route": route,
             "result": result
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error starting analysis: {str(e)}")
+    finally:
+        current_db_session.reset(token)
 
 
 @app.get("/api/agent/status")
@@ -187,7 +253,7 @@ async def get_pending_approvals():
     """Get all pending approval requests"""
     approvals = approval_system.get_pending_approvals()
     return {
-        "approvals": [approval.dict() for approval in approvals]
+        "approvals": [approval.to_dict() for approval in approvals]
     }
 
 
@@ -209,7 +275,7 @@ async def respond_to_approval(
 
     return {
         "status": "success",
-        "request": request.dict()
+        "request": request.to_dict()
     }
 
 
@@ -218,7 +284,7 @@ async def get_approval_history():
     """Get approval history"""
     history = approval_system.get_approval_history()
     return {
-        "history": [approval.dict() for approval in history]
+        "history": [approval.to_dict() for approval in history]
     }
 
 
@@ -268,31 +334,51 @@ async def health_check():
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket for real-time agent updates"""
     await websocket.accept()
-    try:
+
+    # Streamed tokens, todo changes and approval changes are pushed into one
+    # queue per connection; nothing is polled. The latest todo and approval
+    # state is replayed on subscribe, and no agent has to exist yet
+    queue = agent_events.subscribe()
+    todo_events.subscribe(queue)
+    approval_system.subscribe(queue)
+
+    # Hash of the last state event sent per type, so unchanged state is not resent
+    last_sent: Dict[str, int] = {}
+
+    async def send_state(event: Dict[str, Any]):
+        digest = hash(json.dumps(event, sort_keys=True))
+        if last_sent.get(event["type"]) != digest:
+            last_sent[event["type"]] = digest
+            await websocket.send_json(event)
+
+    async def forward_events():
         while True:
-            # Send agent status updates
-            if current_agent:
-                await websocket.send_json({
-                    "type": "status",
-                    "todos": current_agent.todo_middleware.get_todos(),
-                })
-
-            # Check for pending approvals
-            pending = approval_system.get_pending_approvals()
-            if pending:
-                await websocket.send_json({
-                    "type": "approval_required",
-                    "count": len(pending)
-                })
-
-            # Wait before next update
-            import asyncio
-            await asyncio.sleep(2)
+            event = await queue.get()
+            if event["type"] == "token":
+                await websocket.send_json(event)
+            else:
+                await send_state(event)
+
+    try:
+        forwarder = asyncio.create_task(forward_events())
+        try:
+            # Client messages are ignored; receiving notices a disconnect even
+            # while no events are being sent
+            while not forwarder.done():
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+        finally:
+            forwarder.cancel()
 
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        await websocket.close()
+        approval_system.unsubscribe(queue)
+        todo_events.unsubscribe(queue)
+        agent_events.unsubscribe(queue)
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
 
 
 if __name__ == "__main__":
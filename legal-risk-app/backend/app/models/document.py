@@ -1,8 +1,33 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, LargeBinary
+from typing import Optional
+import zstandard
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, LargeBinary, DateTime, Index, text
 from sqlalchemy.orm import relationship, declarative_base
 
 Base = declarative_base()
 
+# Page text is stored zstd-compressed; legal boilerplate shrinks several times over
+PAGE_TEXT_ZSTD_LEVEL = 9
+
+# Full-text index over page text, with rowid = pages.id. It is contentless,
+# since the text itself is only kept compressed in the pages table
+PAGE_TEXT_FTS_DDL = text(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS page_text_fts USING fts5(page_text, content='')"
+)
+PAGE_TEXT_FTS_INSERT = text(
+    "INSERT INTO page_text_fts (rowid, page_text) VALUES (:id, :page_text)"
+)
+
+
+def compress_text(page_text: str) -> bytes:
+    """Compress page text for storage"""
+    return zstandard.compress(page_text.encode("utf-8"), PAGE_TEXT_ZSTD_LEVEL)
+
+
+def decompress_text(data: Optional[bytes]) -> str:
+    """Page text from its stored compressed form"""
+    return zstandard.decompress(data).decode("utf-8") if data else ""
+
+
 class Document(Base):
     """Document model representing a legal document"""
     __tablename__ = "documents"
@@ -26,17 +51,26 @@ class Document(Base):
 class Page(Base):
     """Page model representing a single page in a document"""
     __tablename__ = "pages"
+    # Serves page lookups by document and page number, and keeps page numbers unique per document
+    __table_args__ = (
+        Index("ix_pages_doc_pagenum", "document_id", "page_num", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
     page_num = Column(Integer, nullable=False)  # Page number (1-indexed)
     summdesc = Column(Text, nullable=True)  # Page summary description
-    page_text = Column(Text, nullable=True)  # Extracted text from page
+    page_text_compressed = Column(LargeBinary, nullable=True)  # zstd-compressed extracted text
     page_image_path = Column(String, nullable=True)  # Path to page image
 
     # Relationship to document
     document = relationship("Document", back_populates="pages")
 
+    @property
+    def page_text(self) -> str:
+        """Extracted text from page"""
+        return decompress_text(self.page_text_compressed)
+
     def to_dict(self, include_text=False, include_image_path=False):
         result = {
             "id": self.id,
@@ -49,3 +83,20 @@ class Page(Base):
         if include_image_path:
             result["page_image_path"] = self.page_image_path
         return result
+
+
+class DocumentBundle(Base):
+    """Single-row bundle of all document summaries, kept current at upload time"""
+    __tablename__ = "document_bundles"
+
+    id = Column(Integer, primary_key=True)
+    payload = Column(Text, nullable=False)  # Formatted summaries of all documents
+    updated_at = Column(DateTime, nullable=False)
+
+
+class PageSummaryCache(Base):
+    """Page summaries keyed by page content, reused across documents and reprocessing"""
+    __tablename__ = "page_summary_cache"
+
+    key = Column(String, primary_key=True)  # sha256 of page text + image bytes
+    summary = Column(Text, nullable=False)
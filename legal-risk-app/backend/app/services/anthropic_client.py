@@ -0,0 +1,30 @@
+"""
+Shared Anthropic SDK client
+Direct API calls reuse one pooled HTTP/2 connection instead of opening their own.
+"""
+from functools import lru_cache
+import anthropic
+import httpx
+from config.settings import settings
+
+
+@lru_cache(maxsize=1)
+def get_anthropic_client() -> anthropic.AsyncAnthropic:
+    """Get the process-wide Anthropic client"""
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+        # Concurrent requests are multiplexed over one TLS connection
+        http2=True,
+        timeout=60.0,
+    )
+    return anthropic.AsyncAnthropic(
+        api_key=settings.anthropic_api_key,
+        http_client=http_client,
+        max_retries=2,
+    )
+
+
+async def close_anthropic_client():
+    """Close the shared client, if it was ever created"""
+    if get_anthropic_client.cache_info().currsize:
+        await get_anthropic_client().close()
@@ -1,15 +1,128 @@
 import os
+import asyncio
 import base64
+import hashlib
+import json
+import mimetypes
+import re
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Dict, NamedTuple, Optional, Set, Tuple
 import fitz  # PyMuPDF
 from PIL import Image
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage
 from config.settings import settings
-from app.models.document import Document, Page
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from app.services.anthropic_client import get_anthropic_client
+from app.models.document import (
+    Document,
+    Page,
+    DocumentBundle,
+    PageSummaryCache,
+    PAGE_TEXT_FTS_INSERT,
+    compress_text,
+    decompress_text,
+)
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import selectinload
+
+# The summary bundle is a single row
+DOCUMENT_BUNDLE_ID = 1
+
+# Page summaries requested from Claude Haiku at once
+PAGE_SUMMARY_CONCURRENCY = 10
+
+# Token limit for summary replies
+SUMMARY_MAX_TOKENS = 1024
+
+# Rendered pages waiting to be summarized, per document
+RENDER_QUEUE_SIZE = 20
+
+# Page images sent to Haiku: 72 DPI JPEG is plenty for a one-line summary
+PAGE_IMAGE_ZOOM = 1
+PAGE_IMAGE_JPEG_QUALITY = 75
+
+# Page text sent to Haiku alongside the image, after collapsing whitespace
+PAGE_SUMMARY_TEXT_CHARS = 1500
+
+# On-demand renders for visual inspection of layout, tables and signatures
+HIGH_RES_IMAGE_ZOOM = 2
+
+# Static summary instructions, sent ahead of the per-page or per-document
+# content so Anthropic's prompt cache can reuse them across calls
+PAGE_SUMMARY_INSTRUCTIONS = """Analyze this legal document page and provide a ONE-LINE summary (max 150 characters) that describes what this page contains.
+
+Provide only the summary, no preamble."""
+
+DOCUMENT_SUMMARY_INSTRUCTIONS = """Given the following page-by-page summaries of a legal document, provide a ONE-SENTENCE summary (max 200 characters) of the entire document.
+
+Provide only the document summary, no preamble."""
+
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
+
+# Message batches are split to stay under the API's 256 MB request limit
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+
+def _summary_page_text(page_text: str) -> str:
+    """Page text for a summary prompt: PDF layout whitespace collapsed, then truncated"""
+    return re.sub(r"\s+", " ", page_text).strip()[:PAGE_SUMMARY_TEXT_CHARS]
+
+
+class ExtractedPage(NamedTuple):
+    """Text and rendered image of one PDF page, before summarization"""
+    page_num: int
+    page_text: str
+    image_path: str
+    image_bytes: bytes
+    key: str  # Content hash used by the page summary cache
+
+
+async def refresh_document_bundle(db: AsyncSession) -> str:
+    """
+    Rebuild the bundle of all document summaries from the documents table.
+    The caller commits.
+    """
+    result = await db.execute(
+        select(Document.id, Document.filename, Document.summdesc).order_by(Document.id)
+    )
+    payload = "\n".join(
+        f"- Document {r.id}: {r.filename}\n  Summary: {r.summdesc}" for r in result.all()
+    )
+    await db.merge(DocumentBundle(id=DOCUMENT_BUNDLE_ID, payload=payload, updated_at=datetime.utcnow()))
+    return payload
+
+
+async def get_corpus_version(db: AsyncSession) -> str:
+    """
+    Identifies the current set of documents and summaries; it changes whenever
+    documents are added or removed or the summary bundle is rebuilt
+    """
+    bundle_updated_at = (
+        select(DocumentBundle.updated_at)
+        .where(DocumentBundle.id == DOCUMENT_BUNDLE_ID)
+        .scalar_subquery()
+    )
+    result = await db.execute(
+        select(func.count(Document.id), func.max(Document.id), bundle_updated_at)
+    )
+    return ":".join(str(value) for value in result.one())
+
+
+# PyMuPDF is not thread-safe, so all rendering shares one worker thread
+_render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pdf-render")
+
+
+async def _run_in_render_thread(func: Callable, *args) -> Any:
+    """Run PyMuPDF work off the event loop, on the render thread"""
+    return await asyncio.get_running_loop().run_in_executor(_render_executor, func, *args)
+
+
+def image_media_type(image_path: str) -> str:
+    """Media type of a stored page image; pages processed before JPEG were saved as PNG"""
+    return mimetypes.guess_type(image_path)[0] or "image/png"
+
 
 class DocumentProcessor:
     """Service for processing legal documents"""
@@ -17,11 +130,16 @@ class DocumentProcessor:
     def __init__(self):
         self.documents_path = settings.documents_path
         self.images_path = settings.images_path
-        # Claude Haiku for summarization
-        self.haiku = ChatAnthropic(
-            model=settings.summary_model,
-            anthropic_api_key=settings.anthropic_api_key
-        )
+        # Claude Haiku for summarization, direct and through the Message Batches API
+        self.anthropic = get_anthropic_client()
+        # Background batch summary runs, and the batches they are waiting on
+        self._finalize_tasks: Set[asyncio.Task] = set()
+        self.active_batch_ids: Set[str] = set()
+
+    @property
+    def summaries_pending(self) -> bool:
+        """Whether batch summaries are still being generated in the background"""
+        return bool(self._finalize_tasks)
 
     async def process_document(self, pdf_path: str, db: AsyncSession) -> Document:
         """
@@ -30,138 +148,549 @@ class DocumentProcessor:
         2. Extract text from each page
         3. Summarize each page using Claude Haiku
         4. Combine page summaries and create document summary
+        Pages are summarized as they are rendered; rendering runs off the event loop.
         """
         pdf_file = Path(pdf_path)
-        if not pdf_file.exists():
-            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+        existing_doc = await self._get_existing_document(pdf_file, db)
+        if existing_doc:
+            return existing_doc
 
-        # Check if document already exists
-        result = await db.execute(
-            select(Document).where(Document.filename == pdf_file.name)
-        )
-        existing_doc = result.scalar_one_or_none()
+        # Producer: render pages into a bounded queue; None marks the end. It
+        # is sent after rendering errors too, but not on cancellation, when no
+        # consumer is left to make room for it
+        queue: asyncio.Queue = asyncio.Queue(maxsize=RENDER_QUEUE_SIZE)
+
+        async def produce():
+            pages = self._iter_pages(pdf_file)
+            try:
+                async for page in pages:
+                    await queue.put(page)
+            except Exception:
+                await queue.put(None)
+                raise
+            finally:
+                # Close the PDF now, even when cancelled mid-document
+                await pages.aclose()
+            await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+
+        # Consumer: reuse summaries of identical pages seen before, in any
+        # document, and summarize the rest concurrently
+        semaphore = asyncio.Semaphore(PAGE_SUMMARY_CONCURRENCY)
+
+        async def summarize(page: ExtractedPage) -> str:
+            async with semaphore:
+                return await self._summarize_page(page.page_text, page.image_bytes)
+
+        extracted: List[ExtractedPage] = []
+        summaries: Dict[str, str] = {}
+        # Pages repeated within this document are summarized once
+        tasks: Dict[str, asyncio.Task] = {}
+        try:
+            finished = False
+            while not finished:
+                # Take every page rendered so far, so cache lookups go in bulk
+                batch = [await queue.get()]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+                if batch[-1] is None:
+                    finished = True
+                    batch.pop()
+                extracted.extend(batch)
+
+                summaries.update(await self._get_cached_summaries(
+                    db, [page.key for page in batch if page.key not in tasks]
+                ))
+                for page in batch:
+                    if page.key not in summaries and page.key not in tasks:
+                        tasks[page.key] = asyncio.create_task(summarize(page))
+
+            # Surface rendering errors
+            await producer
+            results = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        except BaseException:
+            producer.cancel()
+            for task in tasks.values():
+                task.cancel()
+            # Wait for the cancelled work to unwind, so nothing outlives the call
+            await asyncio.gather(producer, *tasks.values(), return_exceptions=True)
+            raise
+        print(f"{len(extracted) - len(tasks)}/{len(extracted)} page summaries of {pdf_file.name} cached")
+
+        # Cache what succeeded before failing the document on any error, so
+        # a retry does not pay for the same pages again
+        new_entries = {
+            key: result for key, result in zip(tasks, results)
+            if not isinstance(result, BaseException)
+        }
+        await self._cache_summaries(db, new_entries)
+        await db.commit()
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        summaries.update(new_entries)
+
+        # Create page records
+        pages = [
+            {
+                "page_num": page.page_num,
+                "summdesc": summaries[page.key],
+                "page_text": page.page_text,
+                "page_image_path": page.image_path,
+            }
+            for page in extracted
+        ]
+
+        # Combine all page summaries and create document summary. A one-page
+        # document is described by its page summary, and an empty one has none
+        document_summary = None
+        if len(pages) == 1:
+            document_summary = pages[0]["summdesc"]
+        elif pages:
+            combined_summaries = "\n".join(
+                f"Page {page['page_num']}: {page['summdesc']}" for page in pages
+            )
+            document_summary = await self._summarize_document(combined_summaries)
+
+        # Write everything in one short transaction, so documents processed
+        # concurrently never hold the SQLite write lock across model calls
+        document = Document(filename=pdf_file.name, summdesc=document_summary)
+        db.add(document)
+        await db.flush()
+        await self._insert_pages(db, document, pages)
+
+        # Keep the summary bundle used by the analysis agent current
+        await refresh_document_bundle(db)
+
+        await db.commit()
+
+        return document
+
+    async def prepare_document(self, pdf_path: str, db: AsyncSession) -> Document:
+        """
+        Extract and store a PDF's pages without calling the model.
+        Pages seen before get their cached summary; all other page summaries and
+        the document summary stay NULL until finalize_summaries fills them in.
+        """
+        pdf_file = Path(pdf_path)
+        existing_doc = await self._get_existing_document(pdf_file, db)
         if existing_doc:
             return existing_doc
 
-        # Create document record
+        extracted = [page async for page in self._iter_pages(pdf_file)]
+        summaries = await self._get_cached_summaries(db, [page.key for page in extracted])
+
         document = Document(filename=pdf_file.name)
         db.add(document)
-        await db.flush()  # Get document ID
-
-        # Open PDF
-        pdf_document = fitz.open(pdf_path)
-        page_summaries = []
-
-        # Process each page
-        for page_num in range(len(pdf_document)):
-            print(f"Processing page {page_num + 1}/{len(pdf_document)} of {pdf_file.name}")
-
-            # Extract page
-            page = pdf_document[page_num]
-
-            # Extract text
-            page_text = page.get_text()
-
-            # Convert page to image
-            pix = page.get_pixmap(matrix=fitz.Matrix(2, 2))  # 2x resolution
-            image_filename = f"{document.id}_page_{page_num + 1}.png"
-            image_path = self.images_path / image_filename
-            pix.save(str(image_path))
-
-            # Summarize page using Claude Haiku
-            page_summary = await self._summarize_page(page_text, str(image_path))
-
-            # Create page record
-            page_record = Page(
-                document_id=document.id,
-                page_num=page_num + 1,
-                summdesc=page_summary,
-                page_text=page_text,
-                page_image_path=str(image_path)
+        await db.flush()
+        await self._insert_pages(db, document, [
+            {
+                "page_num": page.page_num,
+                "summdesc": summaries.get(page.key),
+                "page_text": page.page_text,
+                "page_image_path": page.image_path,
+            }
+            for page in extracted
+        ])
+        await db.commit()
+
+        return document
+
+    async def finalize_summaries(self, session_factory: async_sessionmaker, document_ids: List[int]):
+        """
+        Fill in the missing page and document summaries of the given documents
+        through the Message Batches API. Requests that fail, and pages whose
+        image cannot be read, leave their summary NULL, to be retried by the next run.
+        """
+        # Page summaries, one request per distinct page content
+        async with session_factory() as db:
+            result = await db.execute(
+                select(Page.id, Page.page_text_compressed, Page.page_image_path)
+                .where(Page.document_id.in_(document_ids), Page.summdesc.is_(None))
             )
-            db.add(page_record)
-            page_summaries.append(f"Page {page_num + 1}: {page_summary}")
+            pending_pages = result.all()
 
-        pdf_document.close()
+            page_keys: Dict[int, str] = {}
+            page_contents: Dict[str, Tuple[str, bytes, str]] = {}
+            for page in pending_pages:
+                try:
+                    image_bytes = await self.get_page_image_bytes(page.page_image_path)
+                except OSError as e:
+                    print(f"Skipping summary of page {page.id}: {e}")
+                    continue
+                page_text = decompress_text(page.page_text_compressed)
+                key = self._page_cache_key(page_text, image_bytes)
+                page_keys[page.id] = key
+                page_contents.setdefault(
+                    key, (page_text, image_bytes, image_media_type(page.page_image_path))
+                )
 
-        # Combine all page summaries and create document summary
-        combined_summaries = "\n".join(page_summaries)
-        document_summary = await self._summarize_document(combined_summaries)
-        document.summdesc = document_summary
+            # Another run may have summarized the same content meanwhile
+            summaries = await self._get_cached_summaries(db, list(page_contents))
 
-        await db.commit()
-        await db.refresh(document)
+        new_summaries = await self._run_batch({
+            key: self._page_summary_content(page_text, image_bytes, media_type)
+            for key, (page_text, image_bytes, media_type) in page_contents.items()
+            if key not in summaries
+        })
+        summaries.update(new_summaries)
 
-        return document
+        async with session_factory() as db:
+            await self._cache_summaries(db, new_summaries)
+            updates = [
+                {"id": page_id, "summdesc": summaries[key]}
+                for page_id, key in page_keys.items() if key in summaries
+            ]
+            if updates:
+                await db.execute(update(Page), updates)
+            await db.commit()
 
-    async def _summarize_page(self, page_text: str, image_path: str) -> str:
+            # Document summaries, for documents whose pages are all summarized
+            result = await db.execute(
+                select(Document)
+                .where(Document.id.in_(document_ids), Document.summdesc.is_(None))
+                .options(selectinload(Document.pages))
+            )
+            document_contents = {}
+            document_summaries = {}
+            for document in result.scalars():
+                pages = sorted(document.pages, key=lambda p: p.page_num)
+                if not pages or any(page.summdesc is None for page in pages):
+                    continue
+                if len(pages) == 1:
+                    document_summaries[f"document-{document.id}"] = pages[0].summdesc
+                    continue
+                combined_summaries = "\n".join(f"Page {page.page_num}: {page.summdesc}" for page in pages)
+                document_contents[f"document-{document.id}"] = self._document_summary_content(combined_summaries)
+
+        document_summaries.update(await self._run_batch(document_contents))
+
+        async with session_factory() as db:
+            updates = [
+                {"id": int(custom_id.removeprefix("document-")), "summdesc": summary}
+                for custom_id, summary in document_summaries.items()
+            ]
+            if updates:
+                await db.execute(update(Document), updates)
+
+            # Keep the summary bundle used by the analysis agent current
+            await refresh_document_bundle(db)
+            await db.commit()
+
+    def start_finalize_summaries(self, session_factory: async_sessionmaker, document_ids: List[int]) -> asyncio.Task:
         """
-        Summarize a single page using Claude Haiku.
-        Sends both the page image and text to get a one-line description.
+        Run finalize_summaries in the background, since a batch can take hours.
+        Runs are queued behind earlier ones, so no page is submitted twice.
         """
-        # Read and encode image
-        with open(image_path, "rb") as img_file:
-            image_data = base64.b64encode(img_file.read()).decode("utf-8")
+        previous = list(self._finalize_tasks)
 
-        # Create message with both image and text
-        message = HumanMessage(
-            content=[
-                {
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/png",
-                        "data": image_data,
-                    },
+        async def finalize():
+            await asyncio.gather(*previous, return_exceptions=True)
+            await self.finalize_summaries(session_factory, document_ids)
+
+        task = asyncio.create_task(finalize())
+        self._finalize_tasks.add(task)
+        task.add_done_callback(self._finalize_done)
+        return task
+
+    def _finalize_done(self, task: asyncio.Task):
+        self._finalize_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Error finalizing summaries: {task.exception()}")
+
+    async def _run_batch(self, contents: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Run one Haiku request per custom_id through the Message Batches API and
+        wait for the results. Returns the text of each request that succeeded.
+        """
+        if not contents:
+            return {}
+
+        # Split requests so no single batch exceeds the API's size limit
+        chunks: List[List[Dict[str, Any]]] = [[]]
+        chunk_bytes = 0
+        for custom_id, content in contents.items():
+            request = {
+                "custom_id": custom_id,
+                "params": {
+                    "model": settings.summary_model,
+                    "max_tokens": SUMMARY_MAX_TOKENS,
+                    "messages": [{"role": "user", "content": content}],
                 },
-                {
-                    "type": "text",
-                    "text": f"""Analyze this legal document page and provide a ONE-LINE summary (max 150 characters) that describes what this page contains.
+            }
+            request_bytes = len(json.dumps(request))
+            if chunks[-1] and chunk_bytes + request_bytes > MAX_BATCH_BYTES:
+                chunks.append([])
+                chunk_bytes = 0
+            chunks[-1].append(request)
+            chunk_bytes += request_bytes
 
-Page text:
-{page_text[:2000]}  # Limit text to avoid token limits
+        batches = await asyncio.gather(
+            *(self.anthropic.messages.batches.create(requests=chunk) for chunk in chunks)
+        )
 
-Provide only the summary, no preamble."""
+        batch_ids = [batch.id for batch in batches]
+        self.active_batch_ids.update(batch_ids)
+
+        results: Dict[str, str] = {}
+        try:
+            for batch in batches:
+                while batch.processing_status != "ended":
+                    await asyncio.sleep(settings.summary_batch_poll_interval)
+                    batch = await self.anthropic.messages.batches.retrieve(batch.id)
+
+                async for entry in await self.anthropic.messages.batches.results(batch.id):
+                    if entry.result.type == "succeeded":
+                        results[entry.custom_id] = entry.result.message.content[0].text.strip()
+                    else:
+                        print(f"Batch request {entry.custom_id} {entry.result.type}")
+        finally:
+            self.active_batch_ids.difference_update(batch_ids)
+
+        return results
+
+    async def _get_existing_document(self, pdf_file: Path, db: AsyncSession) -> Optional[Document]:
+        """Get the stored document for a PDF, if it was processed before"""
+        if not pdf_file.exists():
+            raise FileNotFoundError(f"PDF file not found: {pdf_file}")
+
+        result = await db.execute(
+            select(Document)
+            .where(Document.filename == pdf_file.name)
+            .options(selectinload(Document.pages))
+        )
+        return result.scalar_one_or_none()
+
+    async def _iter_pages(self, pdf_file: Path) -> AsyncIterator[ExtractedPage]:
+        """
+        Extract text and render an image for each page of a PDF, saving the image.
+        All PyMuPDF work runs on the render thread, one page at a time.
+        """
+        pdf_document = await _run_in_render_thread(fitz.open, str(pdf_file))
+        try:
+            for page_num in range(len(pdf_document)):
+                print(f"Extracting page {page_num + 1}/{len(pdf_document)} of {pdf_file.name}")
+                yield await _run_in_render_thread(self._render_page, pdf_document, page_num, pdf_file)
+        finally:
+            await _run_in_render_thread(pdf_document.close)
+
+    def _render_page(self, pdf_document: fitz.Document, page_num: int, pdf_file: Path) -> ExtractedPage:
+        """Extract one page; called on the render thread"""
+        # Extract page
+        page = pdf_document[page_num]
+
+        # Extract text
+        page_text = page.get_text()
+
+        # Convert page to image
+        pix = page.get_pixmap(matrix=fitz.Matrix(PAGE_IMAGE_ZOOM, PAGE_IMAGE_ZOOM))
+        image_bytes = pix.tobytes("jpg", jpg_quality=PAGE_IMAGE_JPEG_QUALITY)
+        image_filename = f"{pdf_file.stem}_page_{page_num + 1}.jpg"
+        image_path = self.images_path / image_filename
+        image_path.write_bytes(image_bytes)
+
+        return ExtractedPage(
+            page_num=page_num + 1,
+            page_text=page_text,
+            image_path=str(image_path),
+            image_bytes=image_bytes,
+            key=self._page_cache_key(page_text, image_bytes)
+        )
+
+    @staticmethod
+    async def _insert_pages(db: AsyncSession, document: Document, pages: List[Dict[str, Any]]):
+        """
+        Insert a document's pages with one executemany, without building ORM objects.
+        Page text is stored compressed and added to the full-text index. The caller commits.
+        """
+        if pages:
+            await db.execute(insert(Page), [
+                {
+                    "document_id": document.id,
+                    "page_num": page["page_num"],
+                    "summdesc": page["summdesc"],
+                    "page_text_compressed": compress_text(page["page_text"]),
+                    "page_image_path": page["page_image_path"],
                 }
-            ]
+                for page in pages
+            ])
+
+        # Load just the page ids, so the document's page list (and page count) is usable
+        await db.execute(
+            select(Document)
+            .where(Document.id == document.id)
+            .options(selectinload(Document.pages).load_only(Page.id, Page.page_num))
+            .execution_options(populate_existing=True)
         )
 
-        response = await self.haiku.ainvoke([message])
-        return response.content.strip()
+        if pages:
+            page_texts = {page["page_num"]: page["page_text"] for page in pages}
+            await db.execute(PAGE_TEXT_FTS_INSERT, [
+                {"id": page.id, "page_text": page_texts[page.page_num]}
+                for page in document.pages
+            ])
+
+    @staticmethod
+    async def _get_cached_summaries(db: AsyncSession, keys: List[str]) -> Dict[str, str]:
+        """Look up cached page summaries by content key"""
+        if not keys:
+            return {}
+        result = await db.execute(
+            select(PageSummaryCache).where(PageSummaryCache.key.in_(set(keys)))
+        )
+        return {entry.key: entry.summary for entry in result.scalars()}
+
+    @staticmethod
+    async def _cache_summaries(db: AsyncSession, summaries: Dict[str, str]):
+        """
+        Store page summaries by content key. The caller commits.
+        Concurrent documents can share pages, so existing keys are left alone.
+        """
+        if not summaries:
+            return
+        await db.execute(
+            sqlite_insert(PageSummaryCache).on_conflict_do_nothing(),
+            [{"key": key, "summary": summary} for key, summary in summaries.items()]
+        )
+
+    @staticmethod
+    def _page_cache_key(page_text: str, image_bytes: bytes) -> str:
+        """Content hash identifying a page by its text and rendered image"""
+        return hashlib.sha256(page_text.encode("utf-8") + image_bytes).hexdigest()
+
+    @staticmethod
+    def _page_summary_content(
+        page_text: str, image_bytes: bytes, media_type: str = "image/jpeg"
+    ) -> List[Dict[str, Any]]:
+        """
+        Message content asking for a one-line summary of a page image and text.
+        The instructions come first and are marked cacheable; the page follows.
+        """
+        # Encode the rendered image
+        image_data = base64.b64encode(image_bytes).decode("utf-8")
+
+        return [
+            {
+                "type": "text",
+                "text": PAGE_SUMMARY_INSTRUCTIONS,
+                "cache_control": {"type": "ephemeral"},
+            },
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": media_type,
+                    "data": image_data,
+                },
+            },
+            {
+                "type": "text",
+                "text": f"Page text:\n{_summary_page_text(page_text)}",
+            }
+        ]
+
+    @staticmethod
+    def _document_summary_content(combined_page_summaries: str) -> List[Dict[str, Any]]:
+        """Message content asking for a one-sentence summary of a document from its page summaries"""
+        return [
+            {
+                "type": "text",
+                "text": DOCUMENT_SUMMARY_INSTRUCTIONS,
+                "cache_control": {"type": "ephemeral"},
+            },
+            {
+                "type": "text",
+                "text": f"Page summaries:\n{combined_page_summaries}",
+            }
+        ]
+
+    async def _summarize_page(self, page_text: str, image_bytes: bytes) -> str:
+        """
+        Summarize a single page using Claude Haiku.
+        Sends both the page image and text to get a one-line description.
+        """
+        return await self._complete(self._page_summary_content(page_text, image_bytes))
 
     async def _summarize_document(self, combined_page_summaries: str) -> str:
         """
         Summarize the entire document using Claude Haiku.
         Takes combined page summaries and creates a one-sentence document summary.
         """
-        message = HumanMessage(
-            content=f"""Given the following page-by-page summaries of a legal document, provide a ONE-SENTENCE summary (max 200 characters) of the entire document.
+        return await self._complete(self._document_summary_content(combined_page_summaries))
 
-Page summaries:
-{combined_page_summaries}
-
-Provide only the document summary, no preamble."""
+    async def _complete(self, content: List[Dict[str, Any]]) -> str:
+        """Send one user message to Claude Haiku and return the reply text"""
+        response = await self.anthropic.messages.create(
+            model=settings.summary_model,
+            max_tokens=SUMMARY_MAX_TOKENS,
+            messages=[{"role": "user", "content": content}],
+            extra_headers={"anthropic-beta": PROMPT_CACHING_BETA},
         )
+        return response.content[0].text.strip()
+
+    async def process_all_documents(self, session_factory: async_sessionmaker) -> List[Document]:
+        """
+        Process all PDF documents in the documents folder.
+        Documents are processed concurrently, each in its own session. With
+        summary batching enabled, pages are extracted and the documents returned
+        right away; their summaries are then filled in by the Message Batches API
+        in the background (see summaries_pending).
+        """
+        pdf_files = list(self.documents_path.glob("*.pdf"))
+        semaphore = asyncio.Semaphore(settings.document_concurrency)
+        process = self.prepare_document if settings.summary_batch_enabled else self.process_document
 
-        response = await self.haiku.ainvoke([message])
-        return response.content.strip()
+        async def process_one(pdf_file: Path) -> Document:
+            async with semaphore:
+                async with session_factory() as db:
+                    return await process(str(pdf_file), db)
+
+        results = await asyncio.gather(
+            *(process_one(pdf_file) for pdf_file in pdf_files),
+            return_exceptions=True
+        )
 
-    async def process_all_documents(self, db: AsyncSession) -> List[Document]:
-        """Process all PDF documents in the documents folder"""
         documents = []
-        pdf_files = list(self.documents_path.glob("*.pdf"))
+        for pdf_file, result in zip(pdf_files, results):
+            if isinstance(result, Exception):
+                print(f"Error processing {pdf_file.name}: {result}")
+            else:
+                documents.append(result)
 
-        for pdf_file in pdf_files:
-            try:
-                document = await self.process_document(str(pdf_file), db)
-                documents.append(document)
-            except Exception as e:
-                print(f"Error processing {pdf_file.name}: {e}")
+        if settings.summary_batch_enabled and documents:
+            self.start_finalize_summaries(session_factory, [document.id for document in documents])
 
         return documents
 
-    async def get_page_image_as_base64(self, image_path: str) -> str:
-        """Get page image as base64 encoded string"""
-        with open(image_path, "rb") as img_file:
-            image_data = base64.b64encode(img_file.read()).decode("utf-8")
-        return image_data
+    async def get_page_image_bytes(self, image_path: Optional[str]) -> bytes:
+        """
+        Read a stored page image off the event loop
+        Raises FileNotFoundError if the page has no image or the file is gone.
+        """
+        if not image_path:
+            raise FileNotFoundError("Page has no stored image")
+        return await asyncio.to_thread(Path(image_path).read_bytes)
+
+    async def get_page_image_as_base64(self, image_path: Optional[str]) -> str:
+        """
+        Get page image as base64 encoded string
+        Raises FileNotFoundError if the page has no image or the file is gone.
+        """
+        image_bytes = await self.get_page_image_bytes(image_path)
+        return base64.b64encode(image_bytes).decode("utf-8")
+
+    async def render_page_image_as_base64(self, pdf_path: str, page_num: int) -> str:
+        """
+        Render a page from its PDF at high resolution, as base64 encoded PNG.
+        Stored page images are low resolution; this is for close visual inspection.
+        """
+        def render() -> bytes:
+            with fitz.open(pdf_path) as pdf_document:
+                pix = pdf_document[page_num - 1].get_pixmap(
+                    matrix=fitz.Matrix(HIGH_RES_IMAGE_ZOOM, HIGH_RES_IMAGE_ZOOM)
+                )
+                return pix.tobytes("png")
+
+        image_bytes = await _run_in_render_thread(render)
+        return base64.b64encode(image_bytes).decode("utf-8")
@@ -0,0 +1,80 @@
+"""
+In-process event fan-out for real-time updates
+Publishers (agents, todo lists, the approval system) push events to every
+subscribed EventQueue; each consumer (e.g. a WebSocket connection) owns one.
+"""
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set
+
+
+class EventQueue:
+    """
+    Events waiting for one consumer
+    Stream events (e.g. tokens) are buffered in order, and dropped once the
+    buffer is full. State events only ever keep the latest value per type, so
+    they are never lost however far the consumer falls behind.
+    """
+
+    def __init__(self, max_stream_events: int = 1000):
+        self.max_stream_events = max_stream_events
+        self._stream: Deque[Dict[str, Any]] = deque()
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+
+    def put_stream(self, event: Dict[str, Any]):
+        """Queue a stream event, dropping it if the consumer has fallen behind"""
+        if len(self._stream) < self.max_stream_events:
+            self._stream.append(event)
+            self._ready.set()
+
+    def put_state(self, event: Dict[str, Any]):
+        """Set the latest state event of its type, replacing one not yet consumed"""
+        self._state.pop(event["type"], None)
+        self._state[event["type"]] = event
+        self._ready.set()
+
+    async def get(self) -> Dict[str, Any]:
+        """Wait for the next event; pending state events come first"""
+        while not (self._state or self._stream):
+            self._ready.clear()
+            await self._ready.wait()
+        if self._state:
+            return self._state.pop(next(iter(self._state)))
+        return self._stream.popleft()
+
+
+class EventBroadcaster:
+    """
+    Fans out events to subscribed queues
+    A state broadcaster's events describe current state: only the latest one
+    matters, and it is replayed to new subscribers.
+    """
+
+    def __init__(self, state: bool = False):
+        self.state = state
+        self._subscribers: Set[EventQueue] = set()
+        self._latest: Dict[str, Dict[str, Any]] = {}
+
+    def subscribe(self, queue: Optional[EventQueue] = None) -> EventQueue:
+        """Register a consumer queue, creating one unless an existing queue is shared"""
+        if queue is None:
+            queue = EventQueue()
+        self._subscribers.add(queue)
+        for event in self._latest.values():
+            queue.put_state(event)
+        return queue
+
+    def unsubscribe(self, queue: EventQueue):
+        """Remove a consumer queue"""
+        self._subscribers.discard(queue)
+
+    def publish(self, event: Dict[str, Any]):
+        """Send an event to every subscriber"""
+        if self.state:
+            self._latest[event["type"]] = event
+            for queue in self._subscribers:
+                queue.put_state(event)
+        else:
+            for queue in self._subscribers:
+                queue.put_stream(event)
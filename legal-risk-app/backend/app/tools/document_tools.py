@@ -1,16 +1,34 @@
+from functools import lru_cache
 from typing import List, Dict, Optional
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models.document import Document, Page
-from app.services.document_processor import DocumentProcessor
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import selectinload
+from app.models.document import Document, Page, decompress_text
+from app.services.document_processor import DocumentProcessor, image_media_type
+from config.settings import settings
+import asyncio
 import json
 
+# Characters of page text returned per get_page_text call
+PAGE_TEXT_MAX_CHARS = 50_000
+
+# Page images per get_page_image call, and base64 bytes returned per call
+MAX_PAGE_IMAGES = 4
+PAGE_IMAGE_MAX_BYTES = 4 * 1024 * 1024
+
+# Pages returned per search_pages call
+SEARCH_PAGES_MAX_RESULTS = 20
+
+
 class DocumentDatabase:
-    """Shared database connection for tools"""
-    def __init__(self, db_session: AsyncSession):
-        self.db = db_session
+    """Shared database access for tools"""
+    def __init__(self, session_factory: async_sessionmaker):
+        # Each tool call opens its own session, so tools can be shared across
+        # agents and called concurrently
+        self.session_factory = session_factory
         self.processor = DocumentProcessor()
 
 
@@ -32,8 +50,23 @@ class ListDocumentsTool(BaseTool):
 
     async def _arun(self) -> str:
         """List all documents"""
-        result = await self.db.db.execute(select(Document))
-        documents = result.scalars().all()
+        async with self.db.session_factory() as session:
+            return await self._query(session)
+
+    async def _query(self, session: AsyncSession) -> str:
+        # Page counts are aggregated in SQL; page rows are never loaded
+        result = await session.execute(
+            select(
+                Document.id,
+                Document.filename,
+                Document.summdesc,
+                func.count(Page.id).label("page_count")
+            )
+            .outerjoin(Page)
+            .group_by(Document.id)
+            .order_by(Document.id)
+        )
+        documents = result.all()
 
         if not documents:
             return "No documents found in the database."
@@ -44,7 +77,7 @@ class ListDocumentsTool(BaseTool):
                 "doc_id": doc.id,
                 "filename": doc.filename,
                 "summdesc": doc.summdesc,
-                "page_count": len(doc.pages)
+                "page_count": doc.page_count
             })
 
         return json.dumps(doc_list, indent=2)
@@ -72,8 +105,15 @@ class GetDocumentsTool(BaseTool):
 
     async def _arun(self, doc_ids: List[int]) -> str:
         """Get documents with all page summaries"""
-        result = await self.db.db.execute(
-            select(Document).where(Document.id.in_(doc_ids))
+        async with self.db.session_factory() as session:
+            return await self._query(session, doc_ids)
+
+    async def _query(self, session: AsyncSession, doc_ids: List[int]) -> str:
+        # Pages for all documents come in one extra query, without their text
+        result = await session.execute(
+            select(Document)
+            .where(Document.id.in_(doc_ids))
+            .options(selectinload(Document.pages).load_only(Page.page_num, Page.summdesc))
         )
         documents = result.scalars().all()
 
@@ -113,7 +153,9 @@ class GetPageTextTool(BaseTool):
     name: str = "get_page_text"
     description: str = """Get the full text content of specific pages from a document.
     Input: Document ID and list of page numbers (1-indexed)
-    Returns: Page text for each requested page."""
+    Returns: Page text for each requested page. The first page is always returned in full;
+    once the response is long, later pages are cut off and marked page_text_truncated.
+    Request those pages again, starting from the first truncated one."""
     args_schema: type[BaseModel] = GetPageTextInput
     db: DocumentDatabase = Field(exclude=True)
 
@@ -122,26 +164,45 @@ class GetPageTextTool(BaseTool):
 
     async def _arun(self, doc_id: int, page_nums: List[int]) -> str:
         """Get page text for specific pages"""
-        result = await self.db.db.execute(
-            select(Page).where(
+        async with self.db.session_factory() as session:
+            return await self._query(session, doc_id, page_nums)
+
+    async def _query(self, session: AsyncSession, doc_id: int, page_nums: List[int]) -> str:
+        result = await session.execute(
+            select(Page.page_num, Page.summdesc, Page.page_text_compressed)
+            .where(
                 Page.document_id == doc_id,
                 Page.page_num.in_(page_nums)
             )
+            .order_by(Page.page_num)
         )
-        pages = result.scalars().all()
+        pages = result.all()
 
         if not pages:
             return f"No pages found for document {doc_id} with the provided page numbers."
 
+        # Page text is included until the response budget runs out; later
+        # pages keep only their summary so the agent's context is not flooded.
+        # The first page is always whole, so requesting a long page on its own
+        # (or starting from it) always makes progress
+        budget = PAGE_TEXT_MAX_CHARS
         pages_text = []
-        for page in sorted(pages, key=lambda p: p.page_num):
-            pages_text.append({
+        for i, page in enumerate(pages):
+            page_info = {
                 "page_num": page.page_num,
                 "summdesc": page.summdesc,
-                "page_text": page.page_text
-            })
-
-        return json.dumps(pages_text, indent=2)
+            }
+            page_text = decompress_text(page.page_text_compressed)
+            if i == 0 or len(page_text) <= budget:
+                page_info["page_text"] = page_text
+                budget = max(budget - len(page_text), 0)
+            else:
+                page_info["page_text"] = page_text[:budget]
+                page_info["page_text_truncated"] = True
+                budget = 0
+            pages_text.append(page_info)
+
+        return json.dumps(pages_text, ensure_ascii=False, separators=(",", ":"))
 
     def _run(self, doc_id: int, page_nums: List[int]) -> str:
         raise NotImplementedError("Use async version")
@@ -151,6 +212,10 @@ class GetPageImageInput(BaseModel):
     """Input for get page image tool"""
     doc_id: int = Field(description="Document ID")
     page_nums: List[int] = Field(description="List of page numbers to retrieve images for (1-indexed)")
+    high_res: bool = Field(
+        default=False,
+        description="Render at high resolution; only for reading fine print, tables or signatures"
+    )
 
 
 class GetPageImageTool(BaseTool):
@@ -158,51 +223,157 @@ class GetPageImageTool(BaseTool):
     name: str = "get_page_image"
     description: str = """Get images of specific pages from a document. USE SPARINGLY - this is resource intensive.
     Only use when you need to visually inspect the document layout, tables, or diagrams.
-    Input: Document ID and list of page numbers (1-indexed)
-    Returns: Base64 encoded images for each requested page."""
+    Input: Document ID, list of page numbers (1-indexed), and optionally high_res for a
+    sharper render when the standard image is too coarse to read. At most 4 pages per call.
+    Returns: Base64 encoded images for each requested page. The first image is always
+    included; once the response is large, later pages are marked image_truncated. Request
+    those pages again, starting from the first truncated one."""
     args_schema: type[BaseModel] = GetPageImageInput
     db: DocumentDatabase = Field(exclude=True)
 
     class Config:
         arbitrary_types_allowed = True
 
-    async def _arun(self, doc_id: int, page_nums: List[int]) -> str:
+    async def _arun(self, doc_id: int, page_nums: List[int], high_res: bool = False) -> str:
         """Get page images for specific pages"""
-        result = await self.db.db.execute(
-            select(Page).where(
+        if len(page_nums) > MAX_PAGE_IMAGES:
+            return f"Too many pages requested: at most {MAX_PAGE_IMAGES} page images per call."
+
+        async with self.db.session_factory() as session:
+            return await self._query(session, doc_id, page_nums, high_res)
+
+    async def _query(
+        self, session: AsyncSession, doc_id: int, page_nums: List[int], high_res: bool = False
+    ) -> str:
+        result = await session.execute(
+            select(Page.page_num, Page.summdesc, Page.page_image_path)
+            .where(
                 Page.document_id == doc_id,
                 Page.page_num.in_(page_nums)
             )
+            .order_by(Page.page_num)
         )
-        pages = result.scalars().all()
+        pages = result.all()
+
+        if pages and high_res:
+            # High resolution images are rendered on demand from the source PDF
+            result = await session.execute(select(Document.filename).where(Document.id == doc_id))
+            pdf_path = str(settings.documents_path / result.scalar_one())
 
         if not pages:
             return f"No pages found for document {doc_id} with the provided page numbers."
 
+        # Images are read or rendered concurrently
+        if high_res:
+            media_types = ["image/png"] * len(pages)
+            images = await asyncio.gather(
+                *(self.db.processor.render_page_image_as_base64(pdf_path, page.page_num) for page in pages),
+                return_exceptions=True
+            )
+        else:
+            media_types = [image_media_type(page.page_image_path or "") for page in pages]
+            images = await asyncio.gather(
+                *(self.db.processor.get_page_image_as_base64(page.page_image_path) for page in pages),
+                return_exceptions=True
+            )
+
+        # Images are added until the response budget runs out; later pages
+        # keep only their summary. The first image is always included, so
+        # requesting a large page on its own (or starting from it) makes progress
+        budget = PAGE_IMAGE_MAX_BYTES
+        first_image = True
         pages_images = []
-        for page in sorted(pages, key=lambda p: p.page_num):
-            # Get image as base64
-            image_data = await self.db.processor.get_page_image_as_base64(page.page_image_path)
+        for page, media_type, image_data in zip(pages, media_types, images):
+            entry = {"page_num": page.page_num, "summdesc": page.summdesc}
+            # A page that cannot be read or rendered is reported in place, so
+            # the other pages are still returned
+            if isinstance(image_data, FileNotFoundError):
+                entry["error"] = "Page image not found"
+            elif isinstance(image_data, Exception):
+                entry["error"] = f"Could not load page image: {type(image_data).__name__}: {image_data}"
+            elif isinstance(image_data, BaseException):
+                raise image_data
+            elif not first_image and len(image_data) > budget:
+                budget = 0
+                entry["image_truncated"] = True
+            else:
+                first_image = False
+                budget = max(budget - len(image_data), 0)
+                entry["media_type"] = media_type
+                entry["image_base64"] = image_data
+            pages_images.append(entry)
+
+        return json.dumps(pages_images, ensure_ascii=False, separators=(",", ":"))
+
+    def _run(self, doc_id: int, page_nums: List[int], high_res: bool = False) -> str:
+        raise NotImplementedError("Use async version")
 
-            pages_images.append({
-                "page_num": page.page_num,
-                "summdesc": page.summdesc,
-                "image_base64": image_data
-            })
 
-        return json.dumps(pages_images, indent=2)
+class SearchPagesInput(BaseModel):
+    """Input for search pages tool"""
+    query: str = Field(description="Full-text query, e.g. indemnif* AND \"third party\"")
+    doc_id: Optional[int] = Field(default=None, description="Only search this document")
 
-    def _run(self, doc_id: int, page_nums: List[int]) -> str:
+
+class SearchPagesTool(BaseTool):
+    """Tool to find pages by full-text search"""
+    name: str = "search_pages"
+    description: str = """Find the pages whose text matches a full-text query, best matches first.
+    Use this to locate clauses (e.g. which pages mention indemnity) before fetching page text.
+    Input: Query in SQLite FTS5 syntax (words, "exact phrases", prefix*, AND/OR/NOT) and
+    optionally a document ID.
+    Returns: Document ID, page number and summary of up to 20 matching pages."""
+    args_schema: type[BaseModel] = SearchPagesInput
+    db: DocumentDatabase = Field(exclude=True)
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    async def _arun(self, query: str, doc_id: Optional[int] = None) -> str:
+        """Search page text"""
+        async with self.db.session_factory() as session:
+            return await self._query(session, query, doc_id)
+
+    async def _query(self, session: AsyncSession, query: str, doc_id: Optional[int] = None) -> str:
+        statement = """
+            SELECT pages.document_id, pages.page_num, pages.summdesc
+            FROM page_text_fts JOIN pages ON pages.id = page_text_fts.rowid
+            WHERE page_text_fts MATCH :query
+        """
+        params = {"query": query, "limit": SEARCH_PAGES_MAX_RESULTS}
+        if doc_id is not None:
+            statement += " AND pages.document_id = :doc_id"
+            params["doc_id"] = doc_id
+        statement += " ORDER BY page_text_fts.rank LIMIT :limit"
+
+        try:
+            result = await session.execute(text(statement), params)
+        except OperationalError as e:
+            return f"Invalid search query: {e.orig}"
+        pages = result.all()
+
+        if not pages:
+            return f"No pages found matching: {query}"
+
+        matches = [
+            {"doc_id": page.document_id, "page_num": page.page_num, "summdesc": page.summdesc}
+            for page in pages
+        ]
+        return json.dumps(matches, ensure_ascii=False, separators=(",", ":"))
+
+    def _run(self, query: str, doc_id: Optional[int] = None) -> str:
         raise NotImplementedError("Use async version")
 
 
-def create_document_tools(db_session: AsyncSession) -> List[BaseTool]:
-    """Create all document analysis tools with shared database connection"""
-    db = DocumentDatabase(db_session)
+@lru_cache(maxsize=None)
+def create_document_tools(session_factory: async_sessionmaker) -> List[BaseTool]:
+    """Create all document analysis tools, built once per session factory"""
+    db = DocumentDatabase(session_factory)
 
     return [
         ListDocumentsTool(db=db),
         GetDocumentsTool(db=db),
         GetPageTextTool(db=db),
         GetPageImageTool(db=db),
+        SearchPagesTool(db=db),
     ]
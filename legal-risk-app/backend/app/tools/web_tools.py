@@ -1,10 +1,38 @@
-from typing import Optional
+import asyncio
+from functools import lru_cache
+from typing import List, Optional
+import aiohttp
+from selectolax.parser import HTMLParser
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
 from langchain_community.utilities import GoogleSearchAPIWrapper
-from langchain_community.document_loaders import WebBaseLoader
 import os
 
+# Total characters of page text returned per url_content call
+URL_CONTENT_MAX_LENGTH = 10000
+
+# Seconds allowed for fetching one URL
+URL_FETCH_TIMEOUT = 15
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Get the HTTP session shared by web tools, created on first use"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=URL_FETCH_TIMEOUT)
+        )
+    return _http_session
+
+
+async def close_http_session():
+    """Close the shared HTTP session"""
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+
+
 class InternetSearchInput(BaseModel):
     """Input for internet search tool"""
     query: str = Field(description="Search query")
@@ -40,45 +68,67 @@ For testing purposes, consider searching manually or using alternative search to
 
 class URLContentInput(BaseModel):
     """Input for URL content fetching tool"""
-    url: str = Field(description="URL to fetch content from")
+    urls: List[str] = Field(description="One or more URLs to fetch content from")
 
 
 class URLContentTool(BaseTool):
     """Tool for fetching content from URLs (LIMITED USE)"""
     name: str = "url_content"
-    description: str = """Fetch and read content from a specific URL. USE SPARINGLY - this is resource intensive.
+    description: str = """Fetch and read content from specific URLs. USE SPARINGLY - this is resource intensive.
     Only use when you need to read the full content of a specific webpage for detailed analysis.
-    Input: URL string
-    Returns: Extracted text content from the webpage"""
+    Input: List of URL strings; several URLs are fetched in parallel
+    Returns: Extracted text content from each webpage"""
     args_schema: type[BaseModel] = URLContentInput
 
-    async def _arun(self, url: str) -> str:
+    async def _arun(self, urls: List[str]) -> str:
         """Fetch URL content"""
-        try:
-            loader = WebBaseLoader([url])
-            documents = loader.load()
-
-            if not documents:
-                return f"No content found at URL: {url}"
-
-            # Extract text from documents
-            content = "\n\n".join([doc.page_content for doc in documents])
-
-            # Limit content length to avoid token limits
-            max_length = 10000
-            if len(content) > max_length:
-                content = content[:max_length] + "\n\n[Content truncated...]"
-
-            return content
-        except Exception as e:
-            return f"Error fetching URL content: {str(e)}"
-
-    def _run(self, url: str) -> str:
+        if not urls:
+            return "No URLs provided."
+
+        # The length limit is shared between URLs and applied to each page
+        # before joining, so large pages are never held in full
+        max_length = URL_CONTENT_MAX_LENGTH // len(urls)
+        results = await asyncio.gather(
+            *(self._fetch(url, max_length) for url in urls),
+            return_exceptions=True
+        )
+
+        sections = []
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                content = f"Error fetching URL content: {type(result).__name__}: {result}"
+            elif not result:
+                content = f"No content found at URL: {url}"
+            else:
+                content = result
+            sections.append(content if len(urls) == 1 else f"### {url}\n{content}")
+
+        return "\n\n".join(sections)
+
+    async def _fetch(self, url: str, max_length: int) -> str:
+        """Fetch one page and extract its visible text"""
+        async with get_http_session().get(url) as response:
+            response.raise_for_status()
+            html = await response.text(errors="replace")
+
+        tree = HTMLParser(html)
+        for node in tree.css("script, style, noscript"):
+            node.decompose()
+        content = tree.text(separator="\n", strip=True)
+
+        # Limit content length to avoid token limits
+        if len(content) > max_length:
+            content = content[:max_length] + "\n\n[Content truncated...]"
+
+        return content
+
+    def _run(self, urls: List[str]) -> str:
         raise NotImplementedError("Use async version")
 
 
+@lru_cache(maxsize=1)
 def create_web_tools() -> list[BaseTool]:
-    """Create all web research tools"""
+    """Create all web research tools, built once per process"""
     return [
         InternetSearchTool(),
         URLContentTool(),
@@ -9,6 +9,10 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = "sqlite+aiosqlite:///./data/legal_docs.db"
+    db_pool_size: int = 20
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800  # Seconds before a pooled connection is replaced
+    db_busy_timeout: float = 30.0  # Seconds a SQLite connection waits for a lock before failing
 
     # Paths
     documents_path: Path = Path("./data/documents")
@@ -21,6 +25,19 @@ class Settings(BaseSettings):
     # Models
     summary_model: str = "claude-haiku-3-5-20241022"
     agent_model: str = "claude-sonnet-4-5-20250929"
+    router_model: str = "claude-3-haiku-20240307"
+    document_concurrency: int = 4  # Max PDFs processed at once by process-all
+    summary_batch_enabled: bool = False  # Summarize process-all runs through the Message Batches API
+    summary_batch_poll_interval: float = 60.0  # Seconds between batch status checks
+
+    # Agents
+    tool_concurrency_limit: int = 4  # Max sub-agent runs in flight per batch
+    structured_report_enabled: bool = True  # One structured call instead of the Create Report SubAgent
+
+    # Semantic response cache
+    semantic_cache_enabled: bool = True
+    semantic_cache_path: Path = Path("./data/semantic_cache.db")
+    semantic_cache_threshold: float = 0.9  # Min cosine similarity for a hit
 
     class Config:
         env_file = ".env"
@@ -118,7 +118,7 @@ export const WorkflowPanel: React.FC<WorkflowPanelProps> = ({
             <div className="approval-header">
               <span className="approval-type">{approval.type.replace(/_/g, ' ').toUpperCase()}</span>
               <span className="approval-timestamp">
-                {new Date(approval.timestamp).toLocaleTimeString()}
+                {new Date(approval.iso_ts).toLocaleTimeString()}
               </span>
             </div>
 
@@ -45,7 +45,8 @@ export enum ApprovalStatus {
 export interface ApprovalRequest {
   id: string;
   type: ApprovalType;
-  timestamp: string;
+  timestamp: number;  // Unix time in seconds
+  iso_ts: string;
   status: ApprovalStatus;
   data: Record<string, any>;
   agent_name: string;